@@ -0,0 +1,646 @@
+"""
+Benchmark de extremo a extremo sin credenciales ni red.
+
+Levanta un servidor HTTP local que imita los endpoints que usa el bot:
+- OpenAI:   POST /v1/chat/completions (también con stream=True, en SSE)
+- Wikidata: GET  /w/api.php (wbsearchentities, wbgetentities)
+- X (v2):   POST /2/tweets, GET /2/users/<id>/tweets
+
+Los clientes de verdad (openai, requests, tweepy) apuntan a ese servidor, así que se
+mide también el transporte. Cada servicio tiene latencia, tasa de fallos (500) y de
+429 configurables. Informa de tiempo de reloj, llamadas por endpoint y memoria.
+
+Uso:
+    python benchmark.py                       # todos los escenarios
+    python benchmark.py validation-40-90 main-40-90 --repeat 3
+    python benchmark.py main-flaky --json bench.json
+"""
+
+import os
+import sys
+import re
+import json
+import time
+import random
+import argparse
+import resource
+import statistics
+import subprocess
+import tempfile
+import threading
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+# Configuración aislada ANTES de importar main: nada de cachés en disco ni historial,
+# y claves ficticias para que el bot crea que puede publicar.
+BENCH_ENV = {
+    "OPENAI_API_KEY": "bench",
+    "TWITTER_API_KEY": "bench",
+    "TWITTER_API_SECRET": "bench",
+    "TWITTER_ACCESS_TOKEN": "bench",
+    "TWITTER_ACCESS_TOKEN_SECRET": "bench",
+    "TWITTER_BEARER_TOKEN": "bench",
+    "WIKIDATA_CACHE_FILE": "",
+    "OPENAI_CACHE": "0",
+    "TIMELINE_DB_FILE": "",
+    "LABELS_DB_FILE": "",
+    "USE_CANDIDATE_STORE": "0",
+    "WIKIDATA_BACKEND": "http",
+    "WIKIDATA_DAY_INDEX_FILE": "",
+}
+
+# Escenarios: candidatos por ronda, fracción rechazada por Wikidata y, por servicio,
+# latencia en ms, tasa de fallos 500 y tasa de 429.
+SCENARIOS = {
+    "validation-40-90": {
+        "description": "Solo validación: 40 candidatos, 90 % rechazados por fecha.",
+        "mode": "validation",
+        "candidates": 40,
+        "reject": 0.9,
+        "wikidata": {"latency_ms": 80},
+    },
+    "validation-day-index": {
+        "description": "Como validation-40-90, con índice por día construido desde el Wikidata local.",
+        "mode": "validation",
+        "day_index": True,
+        "candidates": 40,
+        "reject": 0.9,
+        "wikidata": {"latency_ms": 80},
+    },
+    "main-40-90": {
+        "description": "main() completo: 40 candidatos por ronda, 90 % rechazados.",
+        "mode": "main",
+        "candidates": 40,
+        "reject": 0.9,
+        "openai": {"latency_ms": 400},
+        "wikidata": {"latency_ms": 80},
+        "x": {"latency_ms": 120},
+    },
+    "main-all-rejected": {
+        "description": "main() completo: ningún candidato valida (todas las rondas, sin publicar).",
+        "mode": "main",
+        "candidates": 30,
+        "reject": 1.0,
+        "openai": {"latency_ms": 400},
+        "wikidata": {"latency_ms": 80},
+        "x": {"latency_ms": 120},
+    },
+    "main-flaky": {
+        "description": "main() con fallos: 5 % de 500 y 5 % de 429 en Wikidata, 10 % de 429 en OpenAI.",
+        "mode": "main",
+        "candidates": 40,
+        "reject": 0.5,
+        "openai": {"latency_ms": 400, "rate_limit": 0.1},
+        "wikidata": {"latency_ms": 80, "failure": 0.05, "rate_limit": 0.05},
+        "x": {"latency_ms": 120},
+    },
+    "main-x-429": {
+        "description": "main() con X devolviendo 429 en el 30 % de los create_tweet.",
+        "mode": "main",
+        "candidates": 20,
+        "reject": 0.5,
+        "openai": {"latency_ms": 400},
+        "wikidata": {"latency_ms": 80},
+        "x": {"latency_ms": 120, "rate_limit": 0.3, "reset_s": 2},
+    },
+    "import-time": {
+        "description": "Arranque en frío: import main y main.py --help en procesos nuevos.",
+        "mode": "import",
+        "runs": 5,
+    },
+    "smoke": {
+        "description": "Smoke test de validación (Felipe III de España vs 07/01) contra el Wikidata local.",
+        "mode": "smoke",
+        "wikidata": {"latency_ms": 80},
+    },
+}
+
+SERVICES = ("openai", "wikidata", "x")
+
+# Módulos pesados que no deberían cargarse solo por importar main
+HEAVY_MODULES = ("requests", "urllib3", "tweepy", "openai", "bs4")
+
+
+# ----------------- Servidor local (OpenAI + Wikidata + X) ----------------- #
+
+class FakeBackend:
+    """
+    Estado compartido del servidor local: entidades conocidas por el Wikidata falso,
+    configuración de fallos por servicio y contadores de llamadas por endpoint.
+    """
+
+    def __init__(self, seed=0):
+        self.lock = threading.Lock()
+        self.random = random.Random(seed)
+        self.services = {name: {"latency_ms": 0, "failure": 0.0, "rate_limit": 0.0} for name in SERVICES}
+        self.candidates = 40
+        self.reject = 0.9
+        self.entities = {}
+        self.labels = {}
+        self.calls = {}
+        self.tweet_ids = 0
+        self.month_names = []
+
+    def configure(self, scenario, latency_scale=1.0):
+        for name in SERVICES:
+            conf = {"latency_ms": 0, "failure": 0.0, "rate_limit": 0.0}
+            conf.update(scenario.get(name, {}))
+            conf["latency_ms"] *= latency_scale
+            self.services[name] = conf
+        self.candidates = scenario.get("candidates", 40)
+        self.reject = scenario.get("reject", 0.9)
+        with self.lock:
+            self.entities.clear()
+            self.labels.clear()
+            self.calls.clear()
+
+    def count(self, endpoint):
+        with self.lock:
+            self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+
+    def fault(self, service, sleep=True):
+        """
+        Duerme la latencia del servicio y decide si la respuesta es un 500, un 429 o normal.
+        Con sleep=False la latencia la reparte quien responde (p. ej. un stream).
+        """
+        conf = self.services[service]
+        if conf["latency_ms"] and sleep:
+            time.sleep(conf["latency_ms"] / 1000)
+        with self.lock:
+            roll = self.random.random()
+        if roll < conf["rate_limit"]:
+            return 429
+        if roll < conf["rate_limit"] + conf["failure"]:
+            return 500
+        return None
+
+    def add_entity(self, label, ddmm, year, cand_type="event"):
+        """Registra una entidad en el Wikidata falso y devuelve su QID."""
+        with self.lock:
+            qid = f"Q{900000 + len(self.entities)}"
+            day, month = ddmm.split("/")
+            prop = {"birth": "P569", "death": "P570"}.get(cand_type, "P585")
+            self.entities[qid] = {
+                "label": label,
+                "prop": prop,
+                "time": f"+{year:04d}-{month}-{day}T00:00:00Z",
+                "human": cand_type in ("birth", "death"),
+            }
+            self.labels[label.lower()] = qid
+            return qid
+
+    def make_candidates(self, today_day, today_month, n=None, tag="r"):
+        """
+        n candidatos "event" para dd/mm; los primeros (según self.reject) llevan otra
+        fecha en Wikidata. Al tener todos el mismo score, el orden editorial es el de
+        la lista, así que el válido aparece tras todos los rechazados.
+        """
+        n = self.candidates if n is None else n
+        rejected = int(round(n * self.reject))
+        events = []
+        for i in range(n):
+            valid = i >= rejected
+            other_day = today_day % 28 + 1
+            ddmm = f"{today_day if valid else other_day:02d}/{today_month:02d}"
+            entity = f"Batalla de prueba {tag}-{i}"
+            self.add_entity(entity, ddmm, 1500 + i)
+            events.append({
+                "year": 1500 + i,
+                "type": "event",
+                "entity": entity,
+                "text": f"Los tercios españoles vencen en la batalla de prueba {tag}-{i}.",
+            })
+        return events
+
+    # --- respuestas por servicio --- #
+
+    def wikidata(self, params):
+        action = params.get("action")
+        if action == "wbsearchentities":
+            qid = self.labels.get((params.get("search") or "").lower())
+            return {"search": [{"id": qid}] if qid else []}
+        if action == "wbgetentities":
+            entities = {}
+            for qid in (params.get("ids") or "").split("|"):
+                entity = self.entities.get(qid)
+                if entity is None:
+                    entities[qid] = {"id": qid, "missing": ""}
+                    continue
+                entities[qid] = self.entity_json(qid, entity)
+            return {"entities": entities}
+        return {"error": {"code": "unknown-action"}}
+
+    @staticmethod
+    def entity_json(qid, entity):
+        """Entidad en el formato de wbgetentities (y de los volcados de Wikidata)."""
+        return {
+            "id": qid,
+            "labels": {"es": {"language": "es", "value": entity["label"]}},
+            "aliases": {},
+            "claims": {
+                entity["prop"]: [{"mainsnak": {"datavalue": {"value": {
+                    "time": entity["time"], "precision": 11,
+                }}}}],
+                "P31": [{"mainsnak": {"datavalue": {"value": {
+                    "id": "Q5" if entity["human"] else "Q178561",
+                }}}}],
+            },
+        }
+
+    def write_dump(self, path):
+        """Vuelca las entidades del Wikidata local en JSON Lines (como un subconjunto de un dump)."""
+        with self.lock:
+            entities = dict(self.entities)
+        with open(path, "w", encoding="utf-8") as f:
+            for qid, entity in entities.items():
+                f.write(json.dumps(self.entity_json(qid, entity), ensure_ascii=False) + "\n")
+
+    def chat(self, body):
+        """Respuesta de chat.completions según el prompt (candidatos, titular, hilo, contradicciones)."""
+        prompt = body["messages"][-1]["content"]
+        round_tag = f"r{self.calls.get('openai.chat', 0)}"
+
+        if "efemérides históricas relevantes" in prompt:
+            match = re.search(r"ocurrieran un (\d+) de (\w+)", prompt)
+            day = int(match.group(1))
+            month = self.month_names.index(match.group(2))
+            content = json.dumps({"events": self.make_candidates(day, month, tag=round_tag)}, ensure_ascii=False)
+        elif "TUITS DEL HILO:" in prompt:
+            raw = prompt.split("TUITS DEL HILO:")[1].split("Tu tarea")[0]
+            content = json.dumps({"fixed": json.loads(raw)}, ensure_ascii=False)
+        elif '"followups"' in prompt or "json_schema" in json.dumps(body.get("response_format") or {}):
+            prefix = re.search(r'"(🇪🇸 [^"]*?,)', prompt).group(1)
+            content = json.dumps({
+                "headline": f"{prefix} los tercios vencen. #TalDiaComoHoy #España #HistoriaDeEspaña #Efemérides",
+                "followups": ["Contexto del hecho.", "Consecuencias del hecho."],
+            }, ensure_ascii=False)
+        elif '"tweets"' in prompt:
+            content = json.dumps({"tweets": ["Contexto del hecho.", "Consecuencias del hecho."]})
+        elif "Debe empezar EXACTAMENTE por:" in prompt:
+            prefix = re.search(r'Debe empezar EXACTAMENTE por: "([^"]*)"', prompt).group(1)
+            content = f"{prefix} los tercios vencen. #TalDiaComoHoy #España #HistoriaDeEspaña #Efemérides"
+        else:
+            content = "{}"
+
+        prompt_tokens = sum(len(m.get("content") or "") for m in body["messages"]) // 4
+        completion_tokens = len(content) // 4
+        return {
+            "id": "chatcmpl-bench",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "bench"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    def create_tweet(self, body):
+        with self.lock:
+            self.tweet_ids += 1
+            tweet_id = str(2000000000000000000 + self.tweet_ids)
+        return {"data": {"id": tweet_id, "text": body.get("text", "")}}
+
+
+def _make_handler(backend):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status, payload, headers=None):
+            data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _fault_response(self, service, status):
+            if status == 429:
+                conf = backend.services[service]
+                if service == "x":
+                    # X no manda Retry-After: solo la cuota y el instante de reset
+                    reset = int(time.time() + conf.get("reset_s", 2))
+                    headers = {"x-rate-limit-remaining": "0", "x-rate-limit-reset": str(reset)}
+                else:
+                    headers = {"Retry-After": "1"}
+                self._send(429, {"title": "Too Many Requests", "detail": "bench"}, headers)
+            else:
+                self._send(500, {"error": f"fallo simulado en {service}"})
+
+        def _send_stream(self, completion, latency_s, chunk_chars=48):
+            """
+            Respuesta de chat.completions en SSE: el 10 % de la latencia antes del primer
+            trozo y el resto repartido entre trozos, como un modelo que va escribiendo.
+            """
+            content = completion["choices"][0]["message"]["content"]
+            pieces = [content[i:i + chunk_chars] for i in range(0, len(content), chunk_chars)] or [""]
+            base = {k: completion[k] for k in ("id", "created", "model")}
+            base["object"] = "chat.completion.chunk"
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+
+            def event(payload):
+                data = f"data: {payload}\n\n".encode("utf-8")
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+            time.sleep(latency_s * 0.1)
+            for piece in pieces:
+                time.sleep(latency_s * 0.9 / len(pieces))
+                event(json.dumps(dict(base, choices=[{
+                    "index": 0, "delta": {"content": piece}, "finish_reason": None,
+                }]), ensure_ascii=False))
+            event(json.dumps(dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}])))
+            event(json.dumps(dict(base, choices=[], usage=completion["usage"])))
+            event("[DONE]")
+            self.wfile.write(b"0\r\n\r\n")
+
+        def _body(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            return json.loads(self.rfile.read(length) or b"{}")
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = {k: v[0] for k, v in parse_qs(url.query).items()}
+            if url.path == "/w/api.php":
+                endpoint, service = f"wikidata.{params.get('action')}", "wikidata"
+            elif url.path.startswith("/2/users/"):
+                endpoint, service = "x.get_users_tweets", "x"
+            else:
+                self._send(404, {"error": "not found"})
+                return
+
+            backend.count(endpoint)
+            status = backend.fault(service)
+            if status:
+                self._fault_response(service, status)
+            elif service == "wikidata":
+                self._send(200, backend.wikidata(params))
+            else:
+                self._send(200, {"meta": {"result_count": 0}})
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            body = self._body()
+            if url.path.endswith("/chat/completions"):
+                endpoint, service = "openai.chat", "openai"
+            elif url.path == "/2/tweets":
+                endpoint, service = "x.create_tweet", "x"
+            else:
+                self._send(404, {"error": "not found"})
+                return
+
+            backend.count(endpoint)
+            stream = service == "openai" and bool(body.get("stream"))
+            status = backend.fault(service, sleep=not stream)
+            if status:
+                self._fault_response(service, status)
+            elif stream:
+                self._send_stream(backend.chat(body), backend.services["openai"]["latency_ms"] / 1000)
+            elif service == "openai":
+                self._send(200, backend.chat(body))
+            else:
+                self._send(201, backend.create_tweet(body))
+
+    return Handler
+
+
+def start_fake_server(backend):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _make_handler(backend))
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name="fake-server", daemon=True)
+    thread.start()
+    return server
+
+
+# ----------------- Conexión del bot al servidor local ----------------- #
+
+def wire_main(base_url):
+    """Importa main y redirige OpenAI, Wikidata y X al servidor local."""
+    for key, value in BENCH_ENV.items():
+        os.environ[key] = value
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    import main
+    import tweepy
+    from openai import OpenAI
+    from requests.adapters import HTTPAdapter
+
+    main.WIKIDATA_API_URL = f"{base_url}/w/api.php"
+    main.client = OpenAI(api_key="bench", base_url=f"{base_url}/v1")
+
+    class _RedirectAdapter(HTTPAdapter):
+        """Reenvía a base_url lo que tweepy manda a https://api.twitter.com."""
+
+        def send(self, request, **kwargs):
+            request.url = request.url.replace("https://api.twitter.com", base_url, 1)
+            return super().send(request, **kwargs)
+
+    class LocalClient(tweepy.Client):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.session.mount("https://api.twitter.com", _RedirectAdapter())
+
+    tweepy.Client = LocalClient
+    return main
+
+
+def reset_main_state(main):
+    """Vacía cachés y contadores entre repeticiones para que cada una parta de cero."""
+    for cache in main._CACHES:
+        cache._entries = None
+        cache.hits = cache.misses = 0
+    with main._openai_usage_lock:
+        main._openai_usage.clear()
+    with main._http_stats_lock:
+        for key in main._http_stats:
+            main._http_stats[key] = 0
+    main._label_resolver = None
+    with main._day_indexes_lock:
+        main._day_indexes.clear()
+    main._day_index_local = threading.local()
+
+
+# ----------------- Ejecución de escenarios ----------------- #
+
+def run_scenario(main, backend, name, scenario, latency_scale=1.0, quiet=True):
+    backend.configure(scenario, latency_scale)
+    reset_main_state(main)
+    today_year, today_month, today_day, _ = main.today_info()
+    today_ddmm = f"{today_day:02d}/{today_month:02d}"
+
+    outcome = None
+    devnull = open(os.devnull, "w") if quiet else None
+    stdout = sys.stdout
+    day_index_file = main.WIKIDATA_DAY_INDEX_FILE
+    if quiet:
+        sys.stdout = devnull
+    if scenario["mode"] == "validation":
+        events = backend.make_candidates(today_day, today_month)
+    if scenario.get("day_index"):
+        # Fuera del tiempo medido: el índice se construye una vez, antes de validar
+        backend.write_dump("bench_dump.jsonl")
+        main.WIKIDATA_DAY_INDEX_FILE = "bench_days.sqlite3"
+        main.build_day_index(["bench_dump.jsonl"], main.WIKIDATA_DAY_INDEX_FILE)
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        if scenario["mode"] == "validation":
+            best = main.choose_best_verified_event(events, [], today_ddmm)
+            outcome = best["entity"] if best else None
+        elif scenario["mode"] == "smoke":
+            backend.add_entity("Felipe III de España", "31/03", 1621, "death")
+            main.run_wikidata_validation_smoke_test()
+            outcome = "ok"
+        else:
+            main.main()
+            outcome = "ok"
+    except BaseException as exc:
+        outcome = f"{type(exc).__name__}: {exc}"
+    finally:
+        wall = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        main.WIKIDATA_DAY_INDEX_FILE = day_index_file
+        sys.stdout = stdout
+        if devnull:
+            devnull.close()
+
+    with backend.lock:
+        calls = dict(sorted(backend.calls.items()))
+    with main._http_stats_lock:
+        http = dict(main._http_stats)
+    return {
+        "scenario": name,
+        "wall_s": round(wall, 3),
+        "outcome": outcome,
+        "calls": calls,
+        "http": http,
+        "openai": main.openai_usage_totals(),
+        "peak_alloc_mb": round(peak / 2**20, 2),
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def run_import_benchmark(name, scenario):
+    """Mide el arranque en frío en procesos nuevos y qué módulos pesados carga import main."""
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, **BENCH_ENV)
+    probe = (
+        "import json, sys, main; "
+        f"print(json.dumps(sorted(m for m in {HEAVY_MODULES!r} if m in sys.modules)))"
+    )
+    commands = {
+        "import main": [sys.executable, "-c", probe],
+        "main.py --help": [sys.executable, "main.py", "--help"],
+    }
+
+    timings = {}
+    loaded = []
+    for label, cmd in commands.items():
+        samples = []
+        for _ in range(max(1, scenario.get("runs", 5))):
+            start = time.perf_counter()
+            proc = subprocess.run(cmd, cwd=repo_dir, env=env, capture_output=True, text=True)
+            samples.append(time.perf_counter() - start)
+            if proc.returncode != 0:
+                return {"scenario": name, "mode": "import", "outcome": proc.stderr.strip().splitlines()[-1:]}
+            if label == "import main":
+                loaded = json.loads(proc.stdout.strip().splitlines()[-1])
+        timings[label] = {"median_s": round(statistics.median(samples), 3), "min_s": round(min(samples), 3)}
+
+    return {"scenario": name, "mode": "import", "outcome": "ok", "timings": timings, "heavy_modules_loaded": loaded}
+
+
+def print_result(result):
+    if result.get("mode") == "import":
+        print(f"⏱️ {result['scenario']}: {result['outcome']}")
+        for label, t in result.get("timings", {}).items():
+            print(f"   {label}: mediana {t['median_s']:.3f} s, mínimo {t['min_s']:.3f} s")
+        if "heavy_modules_loaded" in result:
+            print(f"   módulos pesados cargados por import main: {', '.join(result['heavy_modules_loaded']) or 'ninguno'}")
+        return
+
+    calls = ", ".join(f"{k}={v}" for k, v in result["calls"].items()) or "ninguna"
+    print(
+        f"⏱️ {result['scenario']}: {result['wall_s']:.3f} s | resultado: {result['outcome']}\n"
+        f"   llamadas: {calls}\n"
+        f"   HTTP (requests): {result['http'].get('requests', 0)} peticiones, "
+        f"{result['http'].get('connections_opened', 0)} conexiones, "
+        f"{result['http'].get('bytes', 0)} bytes | OpenAI: {result['openai']['calls']} llamadas, "
+        f"{result['openai']['prompt_tokens']}+{result['openai']['completion_tokens']} tokens\n"
+        f"   memoria: pico {result['peak_alloc_mb']} MB asignados, RSS máx. {result['max_rss_mb']} MB"
+    )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark del bot contra OpenAI, Wikidata y X locales.")
+    parser.add_argument("scenarios", nargs="*", help=f"Escenarios a ejecutar (por defecto todos): {', '.join(SCENARIOS)}.")
+    parser.add_argument("--repeat", type=int, default=1, help="Repeticiones de cada escenario.")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="Multiplica todas las latencias simuladas.")
+    parser.add_argument("--seed", type=int, default=0, help="Semilla de la inyección de fallos.")
+    parser.add_argument("--json", dest="json_path", help="Guarda los resultados en este fichero JSON.")
+    parser.add_argument("--verbose", action="store_true", help="No oculta la salida del bot.")
+    return parser.parse_args(argv)
+
+
+def run(argv=None):
+    args = parse_args(argv)
+    json_path = os.path.abspath(args.json_path) if args.json_path else None
+    names = args.scenarios or list(SCENARIOS)
+    unknown = [n for n in names if n not in SCENARIOS]
+    if unknown:
+        print(f"❌ Escenarios desconocidos: {', '.join(unknown)}")
+        return 2
+
+    backend = FakeBackend(seed=args.seed)
+    server = start_fake_server(backend)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    # Ficheros de estado del bot (diario de publicación, prepared_threads.json...) en un temporal
+    workdir = tempfile.mkdtemp(prefix="efemerides-bench-")
+    os.chdir(workdir)
+    main = wire_main(base_url)
+    backend.month_names = main.MONTH_NAMES
+
+    results = []
+    try:
+        for name in names:
+            print(f"▶️ {name}: {SCENARIOS[name]['description']}")
+            for _ in range(max(1, args.repeat)):
+                if SCENARIOS[name]["mode"] == "import":
+                    result = run_import_benchmark(name, SCENARIOS[name])
+                else:
+                    result = run_scenario(main, backend, name, SCENARIOS[name], args.latency_scale, not args.verbose)
+                print_result(result)
+                results.append(result)
+                for path in (main.PUBLISH_JOURNAL_FILE, main.PREPARED_FILE):
+                    if os.path.exists(path):
+                        os.remove(path)
+    finally:
+        server.shutdown()
+
+    if json_path:
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"💾 Resultados en {json_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(run())
@@ -1,12 +1,46 @@
 import os
-import requests
+import argparse
 import datetime
+import importlib
+import contextlib
+import multiprocessing
 import pytz
 import re
 import json
-from bs4 import BeautifulSoup
-from openai import OpenAI
-import tweepy
+import random
+import hashlib
+import itertools
+import sqlite3
+import tempfile
+import csv
+import gzip
+import html
+import bz2
+import threading
+import time
+import unicodedata
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+
+class _LazyModule:
+    """
+    Módulo que se importa la primera vez que se usa uno de sus atributos.
+    requests, tweepy y openai tardan en cargarse y muchos subcomandos no los necesitan.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+requests = _LazyModule("requests")
+tweepy = _LazyModule("tweepy")
 
 # Zona horaria de referencia
 TZ = "Europe/Madrid"
@@ -95,6 +129,43 @@ CULTURE_LOW_PRIORITY = [
     "discográfica", "disco", "álbum", "single"
 ]
 
+# Formas flexionadas o derivadas de los tokens de arriba: el matcher compara palabras
+# completas (solo añade el plural), así que se listan aquí y cuentan como su token
+KEYWORD_FORMS = {
+    "conquista": [
+        "conquistador", "conquistadora", "conquistado", "conquistada", "conquistó",
+        "conquistan", "conquistaron", "conquistar", "reconquista",
+    ],
+    "derrota": ["derrotado", "derrotada", "derrotó", "derrotan", "derrotaron", "derrotar"],
+    "guerra": ["posguerra", "entreguerras"],
+    "frente": ["enfrentamiento"],
+    "sitio": ["sitiada", "sitiado"],
+    "toma": ["tomada", "tomado"],
+    "revolución": ["contrarrevolución"],
+    "hispano": ["hispanoamérica", "hispanoamericano", "hispanoamericana"],
+    "borbón": ["borbónico", "borbónica"],
+    "valencia": ["valenciano", "valenciana"],
+    "nazi": ["nazismo"],
+    "americano": ["norteamericano"],
+    "americana": ["norteamericana"],
+    "rusia": ["prusia"],
+    "ruso": ["prusiano"],
+    "rusa": ["prusiana"],
+    "radio": ["radiofónico", "radiofónica"],
+    "cine": ["cineasta", "cinematográfico", "cinematográfica"],
+}
+
+# Grupos de tokens que reconoce el matcher de scoring (una sola pasada por texto)
+KEYWORD_GROUPS = {
+    "spanish_actor": SPANISH_ACTOR_TOKENS,
+    "spanish_wide": SPANISH_WIDE_TOKENS,
+    "spanish_theatre": SPANISH_THEATRE_TOKENS,
+    "military": MILITARY_KEYWORDS,
+    "diplomatic": DIPLO_KEYWORDS,
+    "foreign": FOREIGN_TOKENS,
+    "culture": CULTURE_LOW_PRIORITY,
+}
+
 # Claves de X (Twitter) desde los secrets del repositorio
 TW_API_KEY = os.getenv("TWITTER_API_KEY", "")
 TW_API_SECRET = os.getenv("TWITTER_API_SECRET", "")
@@ -104,16 +175,431 @@ TW_BEARER_TOKEN = os.getenv("TWITTER_BEARER_TOKEN", "")
 
 USER_AGENT = "Efemerides_Imp_Bot/1.0 (https://github.com/efemeridesesp/tal-dia-como-hoy-es)"
 WIKIDATA_API_URL = "https://www.wikidata.org/w/api.php"
+# Máximo de ids por llamada a wbgetentities (límite de la API para clientes normales)
+WIKIDATA_BATCH_SIZE = 50
 
-# Cliente de OpenAI (usa OPENAI_API_KEY del entorno)
-client = OpenAI()
+# Cliente de OpenAI (usa OPENAI_API_KEY del entorno); se crea al primer uso
+client = None
+_client_lock = threading.Lock()
 
 # ID numérico de tu cuenta
 TWITTER_USER_ID = "1988838626760032256"
 
-# Fichero para almacenar hilos pendientes por 429
+# Formato antiguo de hilo pendiente (un solo hilo); si aparece, se migra al diario
 PENDING_FILE = "pending_tweet.json"
 
+# Diario de publicación: hilos en cola y el ID de cada tuit ya publicado
+PUBLISH_JOURNAL_FILE = os.getenv("PUBLISH_JOURNAL_FILE", "publish_journal.json")
+
+# Fichero con hilos generados de antemano por dd/mm (modo prepare)
+PREPARED_FILE = os.getenv("PREPARED_FILE", "prepared_threads.json")
+
+
+def _env_int(name, default):
+    """Lee un entero de una variable de entorno, con valor por defecto si falta o es inválido."""
+    try:
+        return int(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+def _env_float(name, default):
+    """Lee un float de una variable de entorno, con valor por defecto si falta o es inválido."""
+    try:
+        return float(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+# Caché persistente de Wikidata (QID por label y claims por QID).
+# WIKIDATA_CACHE_FILE="" desactiva la persistencia (la caché queda solo en memoria).
+WIKIDATA_CACHE_FILE = os.getenv("WIKIDATA_CACHE_FILE", "wikidata_cache.json")
+WIKIDATA_CACHE_TTL_DAYS = _env_float("WIKIDATA_CACHE_TTL_DAYS", 30)
+WIKIDATA_NEGATIVE_TTL_DAYS = _env_float("WIKIDATA_NEGATIVE_TTL_DAYS", 3)
+WIKIDATA_CACHE_MAX_ENTRIES = _env_int("WIKIDATA_CACHE_MAX_ENTRIES", 20000)
+
+# Caché de respuestas de OpenAI (reruns del mismo día casi gratis).
+# Política por punto de llamada: "day" (solo se reutiliza el mismo día en Madrid),
+# "forever" (hasta que caduque el TTL) o "never".
+OPENAI_CACHE_ENABLED = os.getenv("OPENAI_CACHE", "1") == "1"
+OPENAI_CACHE_FILE = os.getenv("OPENAI_CACHE_FILE", "openai_cache.json")
+OPENAI_CACHE_MAX_ENTRIES = _env_int("OPENAI_CACHE_MAX_ENTRIES", 500)
+OPENAI_CACHE_TTL_DAYS = _env_float("OPENAI_CACHE_TTL_DAYS", 30)
+OPENAI_CACHE_POLICY = {
+    "candidates": "day",
+    "headline": "day",
+    "followups": "day",
+    "contradictions": "day",
+    "thread": "day",
+    "audit_extract": "forever",
+}
+# Candidatos en streaming: cada efeméride se manda a validar en cuanto el modelo la
+# termina de escribir, solapando generación y consultas a Wikidata
+OPENAI_STREAM_CANDIDATES = os.getenv("OPENAI_STREAM_CANDIDATES", "1") == "1"
+# Máximo de entidades de rondas anteriores que se piden excluir en el prompt de la siguiente
+CANDIDATE_EXCLUDE_MAX = _env_int("CANDIDATE_EXCLUDE_MAX", 60)
+
+# Motor de validación: "http" (API en vivo), "offline" (solo el índice local construido
+# con build-wikidata-index) o "hybrid" (índice local y, si falta la entidad, API)
+WIKIDATA_BACKEND = os.getenv("WIKIDATA_BACKEND", "http")
+WIKIDATA_INDEX_FILE = os.getenv("WIKIDATA_INDEX_FILE", "wikidata_index.sqlite3")
+WIKIDATA_INDEX_MMAP_BYTES = _env_int("WIKIDATA_INDEX_MMAP_BYTES", 1 << 30)
+# Volcado de ejemplo para comprobar el índice offline sin red (smoke-test --offline)
+WIKIDATA_INDEX_FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "wikidata_sample.jsonl")
+# Índice inverso por día (dd/mm → QIDs que validan ese día, ver build-day-index).
+# Si el fichero no existe, la validación va siempre a los claims de cada QID.
+WIKIDATA_DAY_INDEX_FILE = os.getenv("WIKIDATA_DAY_INDEX_FILE", "wikidata_days.sqlite3")
+
+# Resolución local de labels: labels/alias en español y P31 de cada QID consultado,
+# acumulados entre ejecuciones. LABELS_DB_FILE="" la desactiva (siempre wbsearchentities).
+LABELS_DB_FILE = os.getenv("LABELS_DB_FILE", "labels.sqlite3")
+# Similitud mínima (Dice sobre trigramas) para aceptar un label aproximado
+LABEL_MATCH_THRESHOLD = _env_float("LABEL_MATCH_THRESHOLD", 0.85)
+
+# Búsquedas simultáneas contra Wikidata (bajo para no abusar de la API)
+WIKIDATA_MAX_WORKERS = _env_int("WIKIDATA_MAX_WORKERS", 4)
+
+# Almacén offline de candidatos ya validados, un fichero por dd/mm (ver build-store)
+CANDIDATE_STORE_DIR = os.getenv("CANDIDATE_STORE_DIR", "candidate_store")
+USE_CANDIDATE_STORE = os.getenv("USE_CANDIDATE_STORE", "1") == "1"
+STORE_BUILD_WORKERS = _env_int("STORE_BUILD_WORKERS", 4)
+
+# Generación del texto del hilo: "classic" (titular, hilo y anti-contradicciones por separado)
+# o "structured" (titular + hilo en una sola llamada con esquema JSON)
+THREAD_GENERATION_MODE = os.getenv("THREAD_GENERATION_MODE", "classic")
+
+# Días (empezando por hoy) para los que el modo prepare deja el hilo listo
+PREPARE_DAYS = _env_int("PREPARE_DAYS", 3)
+
+# Modo preview: un hilo revisable por día (Markdown + log) e informe agregado, sin publicar
+PREVIEW_DIR = os.getenv("PREVIEW_DIR", "preview")
+PREVIEW_WORKERS = _env_int("PREVIEW_WORKERS", 4)
+
+# Tuits auditados en paralelo (cada uno: una llamada a OpenAI y dos a Wikidata)
+AUDIT_WORKERS = _env_int("AUDIT_WORKERS", 8)
+# Veredictos de auditoría guardados (reanudación y re-auditorías incrementales)
+AUDIT_DB_FILE = os.getenv("AUDIT_DB_FILE", "audit.sqlite3")
+AUDIT_CHECKPOINT_EVERY = max(1, _env_int("AUDIT_CHECKPOINT_EVERY", 100))
+
+# Historial local (SQLite) de todo lo publicado, para la anti-repetición.
+# TIMELINE_DB_FILE="" vuelve a mirar solo los últimos 50 tuits vía API.
+TIMELINE_DB_FILE = os.getenv("TIMELINE_DB_FILE", "timeline.sqlite3")
+TIMELINE_SYNC_MAX_PAGES = _env_int("TIMELINE_SYNC_MAX_PAGES", 10)
+
+# Pool de conexiones HTTP compartido (keep-alive).
+# HTTP_POOL_MAXSIZE_PER_HOST admite "host=n,host2=m" para ajustar hosts concretos.
+HTTP_POOL_CONNECTIONS = _env_int("HTTP_POOL_CONNECTIONS", 10)
+HTTP_POOL_MAXSIZE = _env_int("HTTP_POOL_MAXSIZE", 4)
+HTTP_POOL_MAXSIZE_PER_HOST = os.getenv("HTTP_POOL_MAXSIZE_PER_HOST", "")
+
+# Publicación en X: ante un 429 se espera (leyendo x-rate-limit-reset, con jitter) en vez
+# de abandonar, como mucho hasta PUBLISH_DEADLINE (hora de Madrid, mismo día) y
+# PUBLISH_MAX_WAIT_MINUTES desde que empieza la publicación. Las respuestas del hilo
+# se espacian con un token bucket (PUBLISH_BURST tuits seguidos, luego PUBLISH_TWEETS_PER_MINUTE).
+PUBLISH_DEADLINE = os.getenv("PUBLISH_DEADLINE", "23:30")
+PUBLISH_MAX_WAIT_MINUTES = _env_float("PUBLISH_MAX_WAIT_MINUTES", 180)
+PUBLISH_TWEETS_PER_MINUTE = _env_float("PUBLISH_TWEETS_PER_MINUTE", 20)
+PUBLISH_BURST = max(1, _env_int("PUBLISH_BURST", 3))
+PUBLISH_MAX_ATTEMPTS = max(1, _env_int("PUBLISH_MAX_ATTEMPTS", 8))
+# Ejecuciones fallidas (por errores que no son 429) tras las que se abandona un hilo del diario
+PUBLISH_JOURNAL_MAX_FAILURES = max(1, _env_int("PUBLISH_JOURNAL_MAX_FAILURES", 3))
+# Días que se conservan en el diario los hilos ya terminados
+PUBLISH_JOURNAL_KEEP_DAYS = _env_int("PUBLISH_JOURNAL_KEEP_DAYS", 14)
+
+# Trazas por etapa: si TRACE_DIR no está vacío, cada ejecución deja ahí un
+# trace-<fecha>-<pid>.jsonl con un span por etapa y las métricas finales.
+TRACE_DIR = os.getenv("TRACE_DIR", "")
+
+
+# ----------------- Trazas y métricas por etapa ----------------- #
+
+_trace_file = None
+_trace_lock = threading.Lock()
+_trace_local = threading.local()
+_trace_ids = itertools.count(1)
+_trace_counters = {}
+
+
+class _NullSpan:
+    """Span que no hace nada: lo que devuelve span() con las trazas desactivadas."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    """Mide una etapa y, al cerrarse, escribe una línea "span" en la traza."""
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+        self.id = next(_trace_ids)
+        self.parent = None
+
+    def __enter__(self):
+        stack = getattr(_trace_local, "stack", None)
+        if stack is None:
+            stack = _trace_local.stack = []
+        self.parent = stack[-1].id if stack else None
+        stack.append(self)
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        return self
+
+    def set(self, **attrs):
+        """Añade atributos al span (resultado, tokens, nº de candidatos...)."""
+        self.attrs.update(attrs)
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.start
+        _trace_local.stack.pop()
+        record = {
+            "type": "span",
+            "id": self.id,
+            "parent": self.parent,
+            "name": self.name,
+            "start": round(self.started_at, 6),
+            "duration_ms": round(duration * 1000, 3),
+            "thread": threading.current_thread().name,
+        }
+        record.update(self.attrs)
+        if exc_type is not None:
+            record["error"] = f"{exc_type.__name__}: {exc}"
+        _trace_write(record)
+        return False
+
+
+def span(name, **attrs):
+    """
+    Context manager que mide una etapa. Con las trazas desactivadas devuelve un
+    span vacío compartido, así que el coste es una comprobación por llamada.
+    """
+    if _trace_file is None:
+        return _NULL_SPAN
+    return _Span(name, attrs)
+
+
+def trace_count(name, n=1):
+    """Suma n a un contador de la traza (no hace nada si está desactivada)."""
+    if _trace_file is None:
+        return
+    with _trace_lock:
+        _trace_counters[name] = _trace_counters.get(name, 0) + n
+
+
+def _trace_write(record):
+    line = json.dumps(record, ensure_ascii=False, default=str)
+    with _trace_lock:
+        if _trace_file is not None:
+            _trace_file.write(line + "\n")
+
+
+def start_trace(command):
+    """Abre la traza de esta ejecución en TRACE_DIR (si está configurado)."""
+    global _trace_file
+    if not TRACE_DIR:
+        return None
+    os.makedirs(TRACE_DIR, exist_ok=True)
+    stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    path = os.path.join(TRACE_DIR, f"trace-{stamp}-{os.getpid()}.jsonl")
+    _trace_file = open(path, "w", encoding="utf-8")
+    _trace_write({"type": "run", "command": command, "started_at": time.time()})
+    print(f"📈 Trazas de esta ejecución en {path}")
+    return path
+
+
+def finish_trace():
+    """Escribe la línea final de métricas (HTTP, cachés, tokens, contadores) y cierra la traza."""
+    global _trace_file
+    if _trace_file is None:
+        return
+    with _http_stats_lock:
+        http = dict(_http_stats)
+    with _openai_usage_lock:
+        openai_stats = {site: dict(stats) for site, stats in _openai_usage.items()}
+    with _trace_lock:
+        counters = dict(_trace_counters)
+    caches = {cache.name: {"hits": cache.hits, "misses": cache.misses} for cache in _CACHES}
+    if _label_resolver is not None:
+        caches["labels"] = {"hits": _label_resolver.hits, "misses": _label_resolver.misses}
+
+    _trace_write({
+        "type": "metrics",
+        "finished_at": time.time(),
+        "http": http,
+        "caches": caches,
+        "openai": openai_stats,
+        "openai_totals": openai_usage_totals(),
+        "counters": counters,
+    })
+    with _trace_lock:
+        _trace_file.close()
+        _trace_file = None
+
+
+# ----------------- Llamadas a OpenAI ----------------- #
+
+_openai_usage = {}
+_openai_usage_lock = threading.Lock()
+
+
+def get_openai_client():
+    """Devuelve el cliente de OpenAI, creándolo (e importando openai) la primera vez."""
+    global client
+    with _client_lock:
+        if client is None:
+            from openai import OpenAI
+            client = OpenAI()
+        return client
+
+
+def _openai_cache_key(call_site, cache_scope, kwargs):
+    """
+    Clave de caché: hash de (modelo, mensajes, temperatura, response_format) más el
+    punto de llamada, el ámbito extra y, con política "day", la fecha de hoy.
+    Devuelve None si la política del punto de llamada es "never".
+    """
+    policy = OPENAI_CACHE_POLICY.get(call_site, "never")
+    if not OPENAI_CACHE_ENABLED or policy == "never":
+        return None
+
+    payload = json.dumps(
+        {
+            "model": kwargs.get("model"),
+            "messages": kwargs.get("messages"),
+            "temperature": kwargs.get("temperature"),
+            "response_format": kwargs.get("response_format"),
+        },
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    digest = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    day = today_date().isoformat() if policy == "day" else "*"
+    return f"{call_site}:{day}:{cache_scope or ''}:{digest}"
+
+
+def openai_chat(call_site, cache_scope=None, **kwargs):
+    """
+    Llama a chat.completions.create y devuelve el texto de la respuesta.
+    call_site identifica el punto de llamada en los logs de latencia y tokens
+    y decide la política de caché (OPENAI_CACHE_POLICY).
+    """
+    cache_key = _openai_cache_key(call_site, cache_scope, kwargs)
+    if cache_key:
+        cached = openai_cache.get(cache_key)
+        if cached is not None:
+            print(f"♻️ OpenAI [{call_site}]: respuesta reutilizada de la caché.")
+            return cached
+
+    with span("openai", call_site=call_site) as sp:
+        start = time.perf_counter()
+        completion = get_openai_client().chat.completions.create(**kwargs)
+        elapsed = time.perf_counter() - start
+        usage = getattr(completion, "usage", None)
+        prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+        completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+        sp.set(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+
+    _record_openai_usage(call_site, elapsed, prompt_tokens, completion_tokens)
+    content = completion.choices[0].message.content or ""
+    _cache_openai_response(call_site, cache_key, content)
+    return content
+
+
+def openai_chat_stream(call_site, cache_scope=None, **kwargs):
+    """
+    Como openai_chat, pero con stream=True: va devolviendo los trozos de texto según
+    llegan. Al terminar contabiliza tokens y guarda la respuesta completa en la misma
+    caché que openai_chat (misma clave), así que si ya estaba se devuelve de una vez.
+    """
+    cache_key = _openai_cache_key(call_site, cache_scope, kwargs)
+    if cache_key:
+        cached = openai_cache.get(cache_key)
+        if cached is not None:
+            print(f"♻️ OpenAI [{call_site}]: respuesta reutilizada de la caché.")
+            yield cached
+            return
+
+    parts = []
+    prompt_tokens = completion_tokens = 0
+    with span("openai", call_site=call_site, stream=True) as sp:
+        start = time.perf_counter()
+        stream = get_openai_client().chat.completions.create(
+            stream=True, stream_options={"include_usage": True}, **kwargs
+        )
+        try:
+            for chunk in stream:
+                usage = getattr(chunk, "usage", None)
+                if usage:
+                    prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+                    completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+                for choice in chunk.choices or ():
+                    text = getattr(choice.delta, "content", None)
+                    if not text:
+                        continue
+                    if not parts:
+                        sp.set(first_chunk_s=round(time.perf_counter() - start, 3))
+                    parts.append(text)
+                    yield text
+        finally:
+            close = getattr(stream, "close", None)
+            if close:
+                close()
+        elapsed = time.perf_counter() - start
+        sp.set(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+
+    _record_openai_usage(call_site, elapsed, prompt_tokens, completion_tokens)
+    _cache_openai_response(call_site, cache_key, "".join(parts))
+
+
+def _record_openai_usage(call_site, elapsed, prompt_tokens, completion_tokens):
+    with _openai_usage_lock:
+        stats = _openai_usage.setdefault(
+            call_site, {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "seconds": 0.0}
+        )
+        stats["calls"] += 1
+        stats["prompt_tokens"] += prompt_tokens
+        stats["completion_tokens"] += completion_tokens
+        stats["seconds"] += elapsed
+
+    print(f"⏱️ OpenAI [{call_site}]: {elapsed:.2f} s, {prompt_tokens}+{completion_tokens} tokens")
+
+
+def _cache_openai_response(call_site, cache_key, content):
+    if cache_key and content:
+        policy = OPENAI_CACHE_POLICY.get(call_site)
+        openai_cache.set(cache_key, content, ttl=36 * 3600 if policy == "day" else None)
+
+
+def openai_usage_totals():
+    """Suma de llamadas y tokens de todos los puntos de llamada hasta ahora."""
+    totals = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0}
+    with _openai_usage_lock:
+        for stats in _openai_usage.values():
+            for key in totals:
+                totals[key] += stats[key]
+    return totals
+
+
+def report_openai_usage():
+    """Imprime llamadas, tokens y latencia acumulados por punto de llamada."""
+    with _openai_usage_lock:
+        items = sorted(_openai_usage.items())
+    for call_site, stats in items:
+        print(
+            f"🧮 OpenAI [{call_site}]: {stats['calls']} llamadas, "
+            f"{stats['prompt_tokens']}+{stats['completion_tokens']} tokens, {stats['seconds']:.2f} s"
+        )
+
 
 # ----------------- Helper para limpiar JSON con ```json ... ``` ----------------- #
 
@@ -144,15 +630,506 @@ def clean_json_from_markdown(raw: str) -> str:
     return s[first_brace:last_brace + 1].strip()
 
 
+# ----------------- Transporte HTTP compartido ----------------- #
+
+_http_stats = {"requests": 0, "connections_opened": 0, "bytes": 0}
+_http_stats_lock = threading.Lock()
+
+_http_session = None
+_http_session_lock = threading.Lock()
+
+
+def _http_stats_incr(key, n=1):
+    with _http_stats_lock:
+        _http_stats[key] = _http_stats.get(key, 0) + n
+
+
+def _counting_http_adapter_class():
+    """
+    HTTPAdapter que cuenta peticiones enviadas y conexiones TCP abiertas.
+    Las clases se definen aquí para no importar requests/urllib3 al arrancar.
+    """
+    from requests.adapters import HTTPAdapter
+    from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+    class _CountingHTTPConnectionPool(HTTPConnectionPool):
+        def _new_conn(self):
+            _http_stats_incr("connections_opened")
+            return super()._new_conn()
+
+    class _CountingHTTPSConnectionPool(HTTPSConnectionPool):
+        def _new_conn(self):
+            _http_stats_incr("connections_opened")
+            return super()._new_conn()
+
+    class _CountingHTTPAdapter(HTTPAdapter):
+        def init_poolmanager(self, *args, **kwargs):
+            super().init_poolmanager(*args, **kwargs)
+            self.poolmanager.pool_classes_by_scheme = {
+                "http": _CountingHTTPConnectionPool,
+                "https": _CountingHTTPSConnectionPool,
+            }
+
+        def send(self, request, **kwargs):
+            _http_stats_incr("requests")
+            return super().send(request, **kwargs)
+
+    return _CountingHTTPAdapter
+
+
+def _pool_sizes_per_host():
+    """Tamaño del pool por host: Wikidata según WIKIDATA_MAX_WORKERS, más los del entorno."""
+    sizes = {"www.wikidata.org": max(1, WIKIDATA_MAX_WORKERS)}
+    for item in HTTP_POOL_MAXSIZE_PER_HOST.split(","):
+        host, _, size = item.partition("=")
+        try:
+            sizes[host.strip()] = max(1, int(size))
+        except ValueError:
+            continue
+    return sizes
+
+
+def get_http_session():
+    """
+    Devuelve la sesión HTTP compartida por todas las llamadas salientes:
+    keep-alive, gzip y USER_AGENT en todas las peticiones.
+    """
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            adapter_class = _counting_http_adapter_class()
+            session = requests.Session()
+            session.headers.update({
+                "User-Agent": USER_AGENT,
+                "Accept-Encoding": "gzip, deflate",
+            })
+            default_adapter = adapter_class(
+                pool_connections=HTTP_POOL_CONNECTIONS,
+                pool_maxsize=HTTP_POOL_MAXSIZE,
+            )
+            session.mount("http://", default_adapter)
+            session.mount("https://", default_adapter)
+            for host, size in _pool_sizes_per_host().items():
+                session.mount(
+                    f"https://{host}/",
+                    adapter_class(pool_connections=1, pool_maxsize=size),
+                )
+            _http_session = session
+        return _http_session
+
+
+def http_get(url, **kwargs):
+    """GET a través de la sesión compartida (cuenta los bytes recibidos)."""
+    resp = get_http_session().get(url, **kwargs)
+    _http_stats_incr("bytes", len(resp.content))
+    return resp
+
+
+def report_http_stats():
+    """Imprime peticiones HTTP y conexiones abiertas frente a reutilizadas."""
+    with _http_stats_lock:
+        total = _http_stats["requests"]
+        opened = _http_stats["connections_opened"]
+    if not total:
+        return
+    print(
+        f"🌐 HTTP: {total} peticiones, {opened} conexiones abiertas, "
+        f"{max(0, total - opened)} reutilizadas."
+    )
+
+
+# ----------------- Caché persistente en disco ----------------- #
+
+_MISSING = object()
+
+# Todas las cachés creadas, para volcarlas a disco al terminar la ejecución
+_CACHES = []
+
+
+class PersistentCache:
+    """
+    Caché clave → valor respaldada por un fichero JSON.
+    Cada entrada tiene su propio TTL y, si se supera max_entries, se desaloja
+    la entrada usada hace más tiempo (LRU). Los valores deben ser serializables a JSON.
+    """
+
+    def __init__(self, name, path, max_entries, default_ttl=None):
+        self.name = name
+        self.path = path or None
+        self.max_entries = max(1, max_entries)
+        self.default_ttl = default_ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = None
+        self._dirty = False
+        self._updates = {}
+        self._lock = threading.Lock()
+        _CACHES.append(self)
+
+    def _load(self):
+        if self._entries is not None:
+            return
+        self._entries = OrderedDict()
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            now = time.time()
+            for key, value, expires_at in data.get("entries", []):
+                if expires_at is not None and expires_at <= now:
+                    continue
+                self._entries[key] = (value, expires_at)
+        except Exception as e:
+            print(f"⚠️ Error leyendo la caché {self.path}, se empieza vacía:", e)
+            self._entries = OrderedDict()
+
+    def get(self, key, default=None):
+        """Devuelve el valor cacheado o default si no existe o ha caducado."""
+        with self._lock:
+            self._load()
+            item = self._entries.get(key)
+            if item is not None:
+                value, expires_at = item
+                if expires_at is None or expires_at > time.time():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                self._dirty = True
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=None):
+        """Guarda un valor. ttl en segundos; None usa el TTL por defecto de la caché."""
+        ttl = self.default_ttl if ttl is None else ttl
+        expires_at = time.time() + ttl if ttl else None
+        with self._lock:
+            self._load()
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._updates[key] = (value, expires_at)
+            self._dirty = True
+
+    def drain_updates(self):
+        """Entradas escritas desde la última llamada, como [clave, valor, caducidad]."""
+        with self._lock:
+            updates = [[k, v, exp] for k, (v, exp) in self._updates.items()]
+            self._updates = {}
+        return updates
+
+    def merge(self, entries):
+        """Incorpora entradas de otro proceso (las de drain_updates) conservando su caducidad."""
+        now = time.time()
+        with self._lock:
+            self._load()
+            for key, value, expires_at in entries:
+                if expires_at is not None and expires_at <= now:
+                    continue
+                self._entries[key] = (value, expires_at)
+                self._entries.move_to_end(key)
+                self._dirty = True
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def save(self):
+        """Vuelca la caché a disco (escritura atómica) si ha cambiado."""
+        with self._lock:
+            if not self.path or not self._dirty or self._entries is None:
+                return
+            data = {
+                "version": 1,
+                "entries": [[k, v, exp] for k, (v, exp) in self._entries.items()],
+            }
+            try:
+                write_json_atomic(self.path, data)
+                self._dirty = False
+            except Exception as e:
+                print(f"⚠️ No se pudo guardar la caché {self.path}:", e)
+
+
+def write_json_atomic(path, data, indent=None):
+    """Escribe JSON en un temporal y lo renombra, para no dejar nunca un fichero a medias."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=indent, separators=None if indent else (",", ":"))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def flush_caches():
+    """Guarda todas las cachés en disco e imprime sus contadores."""
+    for cache in _CACHES:
+        if cache.hits or cache.misses:
+            print(f"🗃️ Caché {cache.name}: {cache.hits} aciertos, {cache.misses} fallos.")
+        cache.save()
+
+
+wikidata_cache = PersistentCache(
+    "wikidata",
+    WIKIDATA_CACHE_FILE,
+    WIKIDATA_CACHE_MAX_ENTRIES,
+    default_ttl=WIKIDATA_CACHE_TTL_DAYS * 86400,
+)
+
+openai_cache = PersistentCache(
+    "openai",
+    OPENAI_CACHE_FILE,
+    OPENAI_CACHE_MAX_ENTRIES,
+    default_ttl=OPENAI_CACHE_TTL_DAYS * 86400,
+)
+
+
+# ----------------- Índice offline de Wikidata (volcado filtrado) ----------------- #
+
+# Propiedades de fecha que se guardan en el índice offline
+INDEX_DATE_PROPS = ("P585", "P580", "P582", "P569", "P570")
+
+_offline_index_local = threading.local()
+
+
+def _open_dump(path):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    if path.endswith(".bz2"):
+        return bz2.open(path, "rt", encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
+
+
+def iter_dump_entities(path):
+    """
+    Recorre en streaming un volcado JSON de Wikidata (una entidad por línea dentro
+    de un array, como los dumps oficiales) o un subconjunto en JSON Lines.
+    """
+    with _open_dump(path) as f:
+        for line in f:
+            line = line.strip().rstrip(",")
+            if not line.startswith("{"):
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+
+def _index_entry(entity):
+    """(qid_num, fechas, p31, rank, labels) de una entidad con fechas, o None."""
+    qid = entity.get("id") or ""
+    if not re.match(r"^Q\d+$", qid):
+        return None
+
+    claims = entity.get("claims", {})
+    dates = {}
+    for prop in INDEX_DATE_PROPS:
+        values = []
+        for claim in claims.get(prop, []):
+            value = (claim.get("mainsnak", {}).get("datavalue") or {}).get("value") or {}
+            if isinstance(value, dict) and value.get("time"):
+                values.append([value["time"], value.get("precision")])
+        if values:
+            dates[prop] = values
+    if not dates:
+        return None
+
+    p31 = []
+    for claim in claims.get("P31", []):
+        value = (claim.get("mainsnak", {}).get("datavalue") or {}).get("value") or {}
+        if isinstance(value, dict) and value.get("id"):
+            p31.append(value["id"])
+
+    labels = set()
+    label = entity.get("labels", {}).get("es", {}).get("value")
+    if label:
+        labels.add(label.strip().lower())
+    for alias in entity.get("aliases", {}).get("es", []):
+        if alias.get("value"):
+            labels.add(alias["value"].strip().lower())
+
+    rank = len(entity.get("sitelinks", {}) or {})
+    return int(qid[1:]), dates, p31, rank, labels
+
+
+def build_wikidata_index(dump_path, index_path=None, batch_size=5000):
+    """
+    Construye el índice offline a partir de un volcado (o subconjunto filtrado) de
+    Wikidata: QID → fechas P585/P580/P582/P569/P570 con su precisión (+ P31) y
+    label/alias en español → QID. Se escribe en un temporal y se renombra al final.
+    """
+    index_path = index_path or WIKIDATA_INDEX_FILE
+    tmp_path = index_path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    conn = sqlite3.connect(tmp_path)
+    conn.executescript(
+        """
+        PRAGMA journal_mode = OFF;
+        PRAGMA synchronous = OFF;
+        CREATE TABLE entities (
+            qid INTEGER PRIMARY KEY,
+            dates TEXT NOT NULL,
+            p31 TEXT NOT NULL,
+            rank INTEGER NOT NULL
+        );
+        CREATE TABLE labels (
+            label TEXT NOT NULL,
+            qid INTEGER NOT NULL
+        );
+        """
+    )
+
+    start = time.perf_counter()
+    seen = 0
+    kept = 0
+    entity_rows = []
+    label_rows = []
+
+    def flush():
+        conn.executemany("INSERT OR REPLACE INTO entities VALUES (?, ?, ?, ?)", entity_rows)
+        conn.executemany("INSERT INTO labels VALUES (?, ?)", label_rows)
+        conn.commit()
+        entity_rows.clear()
+        label_rows.clear()
+
+    for entity in iter_dump_entities(dump_path):
+        seen += 1
+        entry = _index_entry(entity)
+        if entry is None:
+            continue
+        qid_num, dates, p31, rank, labels = entry
+        entity_rows.append((qid_num, json.dumps(dates, separators=(",", ":")), ",".join(p31), rank))
+        label_rows.extend((label, qid_num) for label in labels)
+        kept += 1
+        if len(entity_rows) >= batch_size:
+            flush()
+            print(f"📚 Índice Wikidata: {kept} entidades con fecha de {seen} leídas.")
+
+    flush()
+    conn.execute("CREATE INDEX idx_labels_label ON labels (label)")
+    conn.commit()
+    conn.execute("VACUUM")
+    conn.close()
+    os.replace(tmp_path, index_path)
+
+    print(
+        f"✅ Índice Wikidata en {index_path}: {kept} entidades con fecha de {seen} "
+        f"({time.perf_counter() - start:.1f} s)."
+    )
+    return kept
+
+
+def _offline_index():
+    """Conexión de solo lectura (una por hilo, con mmap) al índice offline, o None si no existe."""
+    conn = getattr(_offline_index_local, "conn", None)
+    if conn is None:
+        if not os.path.exists(WIKIDATA_INDEX_FILE):
+            return None
+        conn = sqlite3.connect(f"file:{WIKIDATA_INDEX_FILE}?mode=ro", uri=True)
+        conn.execute(f"PRAGMA mmap_size = {WIKIDATA_INDEX_MMAP_BYTES}")
+        _offline_index_local.conn = conn
+    return conn
+
+
+def offline_search_entity_id(label):
+    """QID de un label/alias en español según el índice offline (el de más sitelinks), o None."""
+    conn = _offline_index()
+    if conn is None or not label:
+        return None
+    row = conn.execute(
+        "SELECT e.qid FROM labels l JOIN entities e ON e.qid = l.qid "
+        "WHERE l.label = ? ORDER BY e.rank DESC LIMIT 1",
+        (label.strip().lower(),),
+    ).fetchone()
+    return f"Q{row[0]}" if row else None
+
+
+def offline_dates_for_qid(qid):
+    """
+    Fechas de un QID según el índice offline, con el mismo formato que fetch_dates_for_qid.
+    None si el QID no está en el índice.
+    """
+    conn = _offline_index()
+    if conn is None or not qid or not re.match(r"^Q\d+$", qid):
+        return None
+    row = conn.execute("SELECT dates FROM entities WHERE qid = ?", (int(qid[1:]),)).fetchone()
+    if not row:
+        return None
+    return _dates_with_day_precision(json.loads(row[0]))
+
+
+def _dates_with_day_precision(stored):
+    """{prop: [[time, precision]]} del índice → {prop: [time]} solo con las fechas de precisión de día."""
+    dates = {}
+    for prop in INDEX_DATE_PROPS:
+        dates[prop] = [
+            time_str for time_str, precision in stored.get(prop, [])
+            if precision is None or precision >= WIKIDATA_DAY_PRECISION
+        ]
+    return dates
+
+
 # ----------------- Wikidata (validación determinista de fechas) ----------------- #
 
+_wikidata_slots = threading.BoundedSemaphore(max(1, WIKIDATA_MAX_WORKERS))
+
+# Consultas a Wikidata que fallaron (red, 5xx...) en cada hilo: search_entity_id y
+# fetch_dates_for_qid devuelven entonces None / {}, igual que si no hubiera datos
+_wikidata_failures = threading.local()
+
+
+def _note_wikidata_failure():
+    _wikidata_failures.count = getattr(_wikidata_failures, "count", 0) + 1
+
+
+def wikidata_failure_count():
+    """Consultas fallidas a Wikidata en este hilo: si cambia, un "sin datos" puede ser un error de red."""
+    return getattr(_wikidata_failures, "count", 0)
+
+
+def _with_failure_flag(func, *args):
+    """
+    Llama a func(*args) y devuelve (resultado, falló), con falló=True si alguna consulta
+    a Wikidata dio error por el camino. Para búsquedas lanzadas en un pool: el contador
+    es por hilo y quien consume el Future no lo ve.
+    """
+    failures = wikidata_failure_count()
+    result = func(*args)
+    return result, wikidata_failure_count() != failures
+
+
+def _wikidata_api_get(params):
+    """
+    GET a la API de Wikidata. Como mucho WIKIDATA_MAX_WORKERS peticiones
+    simultáneas en todo el proceso, vengan del hilo que vengan.
+    """
+    with span("wikidata", action=params.get("action")) as sp, _wikidata_slots:
+        resp = http_get(WIKIDATA_API_URL, params=params, timeout=20)
+        sp.set(status=resp.status_code, bytes=len(resp.content))
+    resp.raise_for_status()
+    return resp.json()
+
+
 def search_entity_id(label: str):
     """
     Busca un QID en Wikidata a partir de un label en español.
+    Usa la caché persistente (también recuerda los labels sin QID).
     """
     if not label:
         return None
 
+    if WIKIDATA_BACKEND != "http":
+        qid = offline_search_entity_id(label)
+        if qid or WIKIDATA_BACKEND == "offline":
+            return qid
+
+    cache_key = f"search:es:{label.strip().lower()}"
+    cached = wikidata_cache.get(cache_key, _MISSING)
+    if cached is not _MISSING:
+        return cached
+
     params = {
         "action": "wbsearchentities",
         "search": label,
@@ -162,18 +1139,24 @@ def search_entity_id(label: str):
     }
 
     try:
-        resp = requests.get(WIKIDATA_API_URL, params=params, timeout=20)
-        resp.raise_for_status()
-        data = resp.json()
+        data = _wikidata_api_get(params)
     except Exception as exc:
+        _note_wikidata_failure()
         print(f"⚠️ Error buscando entidad Wikidata para '{label}': {exc}")
         return None
 
     results = data.get("search", [])
     if not results:
+        wikidata_cache.set(cache_key, None, ttl=WIKIDATA_NEGATIVE_TTL_DAYS * 86400)
         return None
 
-    return results[0].get("id")
+    qid = results[0].get("id")
+    wikidata_cache.set(cache_key, qid)
+    return qid
+
+
+# Precisión de día en los valores de tiempo de Wikidata (9 = año, 10 = mes, 11 = día)
+WIKIDATA_DAY_PRECISION = 11
 
 
 def _extract_time_values(claims, prop):
@@ -185,43 +1168,118 @@ def _extract_time_values(claims, prop):
             continue
         value = datavalue.get("value", {})
         time_str = value.get("time")
+        # Un "+1492-01-01" con precisión de año no dice nada del día ni del mes
+        precision = value.get("precision")
+        if precision is not None and precision < WIKIDATA_DAY_PRECISION:
+            continue
         if time_str:
             times.append(time_str)
     return times
 
 
+def _dates_from_claims(claims):
+    return {
+        "P585": _extract_time_values(claims, "P585"),
+        "P580": _extract_time_values(claims, "P580"),
+        "P582": _extract_time_values(claims, "P582"),
+        "P569": _extract_time_values(claims, "P569"),
+        "P570": _extract_time_values(claims, "P570"),
+    }
+
+
 def fetch_dates_for_qid(qid: str):
     """
     Devuelve un dict con posibles fechas a partir de claims de Wikidata.
+    Usa la caché persistente por QID.
     """
     if not qid:
         return {}
 
+    if WIKIDATA_BACKEND != "http":
+        dates = offline_dates_for_qid(qid)
+        if dates is not None or WIKIDATA_BACKEND == "offline":
+            return dates or {}
+
+    cache_key = f"claims:{qid}"
+    cached = wikidata_cache.get(cache_key, _MISSING)
+    if cached is not _MISSING:
+        return cached
+
     params = {
         "action": "wbgetentities",
         "ids": qid,
-        "props": "claims",
+        "props": "claims|labels|aliases",
+        "languages": "es",
         "format": "json",
     }
 
     try:
-        resp = requests.get(WIKIDATA_API_URL, params=params, timeout=20)
-        resp.raise_for_status()
-        data = resp.json()
+        data = _wikidata_api_get(params)
     except Exception as exc:
+        _note_wikidata_failure()
         print(f"⚠️ Error consultando Wikidata para {qid}: {exc}")
         return {}
 
     entity = data.get("entities", {}).get(qid, {})
-    claims = entity.get("claims", {})
+    record_entity_labels([entity])
+    dates = _dates_from_claims(entity.get("claims", {}))
+    wikidata_cache.set(cache_key, dates)
+    return dates
 
-    return {
-        "P585": _extract_time_values(claims, "P585"),
-        "P580": _extract_time_values(claims, "P580"),
-        "P582": _extract_time_values(claims, "P582"),
-        "P569": _extract_time_values(claims, "P569"),
-        "P570": _extract_time_values(claims, "P570"),
-    }
+
+def fetch_dates_for_qids(qids):
+    """
+    Versión por lotes de fetch_dates_for_qid: pide a wbgetentities hasta
+    WIKIDATA_BATCH_SIZE QIDs por llamada y devuelve {qid: fechas}.
+    Los QIDs ya cacheados no generan tráfico.
+    """
+    result = {}
+    pending = []
+    for qid in dict.fromkeys(q for q in qids if q):
+        if WIKIDATA_BACKEND != "http":
+            dates = offline_dates_for_qid(qid)
+            if dates is not None or WIKIDATA_BACKEND == "offline":
+                result[qid] = dates or {}
+                continue
+        cached = wikidata_cache.get(f"claims:{qid}", _MISSING)
+        if cached is not _MISSING:
+            result[qid] = cached
+        else:
+            pending.append(qid)
+
+    for start in range(0, len(pending), WIKIDATA_BATCH_SIZE):
+        batch = pending[start:start + WIKIDATA_BATCH_SIZE]
+        params = {
+            "action": "wbgetentities",
+            "ids": "|".join(batch),
+            "props": "claims|labels|aliases",
+            "languages": "es",
+            "format": "json",
+        }
+
+        try:
+            data = _wikidata_api_get(params)
+        except Exception as exc:
+            # Si falla el lote, esos QIDs se consultarán uno a uno más tarde
+            trace_count("retries")
+            print(f"⚠️ Error consultando Wikidata por lotes ({len(batch)} QIDs): {exc}")
+            continue
+
+        entities = {}
+        for key, entity in data.get("entities", {}).items():
+            entities[key] = entity
+            # Los QIDs redirigidos vuelven bajo el id de destino
+            redirected_from = entity.get("redirects", {}).get("from")
+            if redirected_from:
+                entities[redirected_from] = entity
+        record_entity_labels(data.get("entities", {}).values())
+
+        for qid in batch:
+            dates = _dates_from_claims(entities.get(qid, {}).get("claims", {}))
+            wikidata_cache.set(f"claims:{qid}", dates)
+            result[qid] = dates
+
+    return result
 
 
 def normalize_ddmm(wikidata_time_str):
@@ -265,114 +1323,835 @@ def validate_candidate_with_wikidata(candidate, today_ddmm):
     cand_type = candidate.get("type")
     print(f"🔍 Wikidata: validando '{entity}' ({cand_type})")
 
-    qid = search_entity_id(entity)
-    if not qid:
-        print("   -> Sin QID encontrado. Descartado.")
-        return False
+    return _check_candidate_dates(candidate, resolve_entity_id(entity, cand_type), today_ddmm)
 
-    dates = fetch_dates_for_qid(qid)
 
+def candidate_ddmm_from_dates(cand_type, dates):
+    """
+    Aplica las reglas de fecha por tipo (event: P585 → P580 → P582; birth: P569;
+    death: P570). Devuelve (ddmm, motivo, propiedad); ddmm es None si no hay una
+    fecha exacta y única que valga para ese tipo.
+    """
     if cand_type == "event":
         for prop in ("P585", "P580", "P582"):
             ddmm, reason = _pick_unique_ddmm(dates.get(prop, []))
-            print(f"   -> {prop} ddmm: {ddmm}")
             if ddmm is None:
                 if reason == "ambigüedad de fechas en Wikidata":
-                    print(f"   -> Descartado: {reason}.")
-                    return False
+                    return None, reason, prop
                 continue
-            if ddmm == today_ddmm:
-                print("   -> Fecha coincide. Válido.")
-                return True
-            print("   -> Fecha no coincide. Descartado.")
-            return False
+            return ddmm, None, prop
+        return None, "sin fecha exacta en Wikidata", None
 
-        print("   -> Sin fecha exacta. Descartado.")
-        return False
+    prop = {"birth": "P569", "death": "P570"}.get(cand_type)
+    if prop is None:
+        return None, "tipo desconocido", None
+    ddmm, reason = _pick_unique_ddmm(dates.get(prop, []))
+    return ddmm, reason, prop
 
-    if cand_type == "birth":
-        ddmm, reason = _pick_unique_ddmm(dates.get("P569", []))
-        print(f"   -> P569 ddmm: {ddmm}")
-        if ddmm == today_ddmm:
-            print("   -> Fecha coincide. Válido.")
-            return True
-        print(f"   -> Descartado: {reason or 'fecha no coincide'}.")
-        return False
 
-    if cand_type == "death":
-        ddmm, reason = _pick_unique_ddmm(dates.get("P570", []))
-        print(f"   -> P570 ddmm: {ddmm}")
-        if ddmm == today_ddmm:
-            print("   -> Fecha coincide. Válido.")
-            return True
-        print(f"   -> Descartado: {reason or 'fecha no coincide'}.")
+def _check_candidate_dates(candidate, qid, today_ddmm):
+    """Aplica las reglas de fecha por tipo a un candidato con el QID ya resuelto."""
+    if not qid:
+        print("   -> Sin QID encontrado. Descartado.")
         return False
 
-    print("   -> Tipo desconocido. Descartado.")
+    dates = fetch_dates_for_qid(qid)
+    ddmm, reason, prop = candidate_ddmm_from_dates(candidate.get("type"), dates)
+    print(f"   -> {prop or 'Fecha'} ddmm: {ddmm}")
+    if ddmm == today_ddmm:
+        print("   -> Fecha coincide. Válido.")
+        return True
+    print(f"   -> Descartado: {reason or 'fecha no coincide'}.")
     return False
 
 
-# ----------------- Gestión de hilos pendientes ----------------- #
+# ----------------- Índice inverso por día (dd/mm → QIDs) ----------------- #
 
-def load_pending_tweet():
-    """Carga un hilo pendiente del fichero JSON, si existe y es válido."""
-    if not os.path.exists(PENDING_FILE):
-        return None
-    try:
-        with open(PENDING_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        headline = data.get("headline")
-        followups = data.get("followups", [])
-        target_ddmm = data.get("target_ddmm")
-        if not isinstance(headline, str) or not headline.strip():
-            return None
-        if not isinstance(followups, list):
-            followups = []
-        followups = [str(t) for t in followups]
-        if not isinstance(target_ddmm, str):
-            target_ddmm = None
-        return {"headline": headline, "followups": followups, "target_ddmm": target_ddmm}
-    except Exception as e:
-        print("⚠️ Error leyendo pending_tweet.json:", e)
-        return None
+# Propiedades de fecha que usa cada tipo de candidato (ver candidate_ddmm_from_dates)
+CANDIDATE_DATE_PROPS = {
+    "event": ("P585", "P580", "P582"),
+    "birth": ("P569",),
+    "death": ("P570",),
+}
 
+_day_index_local = threading.local()
+_day_indexes = {}
+_day_indexes_lock = threading.Lock()
 
-def save_pending_tweet(headline, followups, target_ddmm):
-    """Guarda un hilo pendiente en el fichero JSON."""
-    try:
-        data = {
-            "headline": headline,
-            "followups": list(followups or []),
-            "target_ddmm": target_ddmm,
-            "saved_at": datetime.datetime.utcnow().isoformat() + "Z",
-        }
-        with open(PENDING_FILE, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-        print("💾 Hilo guardado en pending_tweet.json para publicar más adelante.")
-    except Exception as e:
-        print("⚠️ No se pudo guardar el hilo pendiente:", e)
 
+def _sparql_value(row, name):
+    return (row.get(name) or {}).get("value")
 
-def clear_pending_tweet():
-    """Elimina el fichero de hilo pendiente si existe."""
-    try:
-        if os.path.exists(PENDING_FILE):
-            os.remove(PENDING_FILE)
-            print("🧹 pending_tweet.json eliminado tras publicar el hilo pendiente.")
-    except Exception as e:
-        print("⚠️ No se pudo eliminar pending_tweet.json:", e)
 
+def _iter_sparql_entities(path):
+    """
+    Entidades de un fichero de resultados SPARQL en JSON (application/sparql-results+json,
+    también .gz/.bz2). Columnas: ?item, la fecha (?date con ?prop, o una columna por
+    propiedad: ?P585, ?P569...), ?precision (wikibase:timePrecision vía p:/psv:) e
+    ?itemLabel opcional. Genera (qid_num, {prop: [time]}, {labels normalizados}).
+    Con wdt: un año suelto llega como "AAAA-01-01", así que una fecha sin ?precision no
+    se da por exacta: el tipo de candidato que la usa queda fuera del índice para esa
+    entidad y lo decide la validación por claims.
+    """
+    with _open_dump(path) as f:
+        data = json.load(f)
+
+    entities = {}
+    for row in data.get("results", {}).get("bindings", []):
+        match = re.search(r"Q(\d+)$", _sparql_value(row, "item") or "")
+        if not match:
+            continue
+        dates, labels, uncertain = entities.setdefault(int(match.group(1)), ({}, set(), set()))
+
+        try:
+            precision = int(_sparql_value(row, "precision") or "")
+        except ValueError:
+            precision = None
+        found = [(prop, _sparql_value(row, prop)) for prop in INDEX_DATE_PROPS if _sparql_value(row, prop)]
+        prop_match = re.search(r"(P\d+)$", _sparql_value(row, "prop") or "")
+        if prop_match and _sparql_value(row, "date"):
+            found.append((prop_match.group(1), _sparql_value(row, "date")))
+        for prop, time_str in found:
+            if prop not in INDEX_DATE_PROPS:
+                continue
+            if precision is None:
+                uncertain.add(prop)
+            elif precision >= WIKIDATA_DAY_PRECISION:
+                dates.setdefault(prop, []).append(time_str)
+
+        label = _sparql_value(row, "itemLabel")
+        if label and not re.fullmatch(r"Q\d+", label):
+            labels.add(normalize_label(label))
+
+    for qid_num, (dates, labels, uncertain) in entities.items():
+        for props in CANDIDATE_DATE_PROPS.values():
+            if uncertain.intersection(props):
+                for prop in props:
+                    dates.pop(prop, None)
+        yield qid_num, dates, labels
 
-# ----------------- Anti-repetición (timeline X) ----------------- #
 
-def fetch_previous_events_same_day(month, day):
+def _iter_day_index_source(path):
     """
-    Lee solo los últimos tuits del usuario y detecta titulares del mismo día
-    (para no repetir efemérides). Usa UNA sola llamada para evitar 429.
-    Si hay rate limit (429) u otro error, devolvemos [] y no rompemos nada.
+    Entidades (qid_num, {prop: [time]}, {labels normalizados}) de una fuente para el
+    índice por día: resultados SPARQL en JSON, un volcado de Wikidata (o subconjunto,
+    como en build-wikidata-index) o el propio índice offline ya construido (.sqlite3).
     """
-    if not TW_BEARER_TOKEN:
-        return []
+    if path.endswith((".sqlite3", ".sqlite", ".db")):
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            rows = conn.execute(
+                "SELECT e.qid, e.dates, group_concat(l.label, char(31)) "
+                "FROM entities e LEFT JOIN labels l ON l.qid = e.qid GROUP BY e.qid"
+            )
+            for qid_num, dates, labels in rows:
+                norms = {normalize_label(label) for label in (labels or "").split("\x1f") if label}
+                yield qid_num, _dates_with_day_precision(json.loads(dates)), norms
+        finally:
+            conn.close()
+        return
+
+    with _open_dump(path) as f:
+        head = f.read(4096)
+    if head.lstrip().startswith("{") and '"head"' in head:
+        yield from _iter_sparql_entities(path)
+        return
+
+    for entity in iter_dump_entities(path):
+        entry = _index_entry(entity)
+        if entry is None:
+            continue
+        qid_num, dates, _, _, labels = entry
+        yield qid_num, _dates_with_day_precision(dates), {normalize_label(label) for label in labels}
+
+
+def build_day_index(sources, index_path=None, batch_size=5000):
+    """
+    Construye el índice inverso por día: para cada dd/mm, los QIDs que validarían
+    como event/birth/death ese día (mismas reglas que candidate_ddmm_from_dates),
+    con sus labels normalizados. Las fuentes son ficheros de resultados SPARQL, un
+    volcado (o subconjunto) de Wikidata o el índice offline; lo habitual es partir
+    de una consulta ya filtrada a entidades relacionadas con España. Las fechas de
+    una entidad se evalúan dentro de cada fuente: no conviene repartirlas entre varias.
+    """
+    index_path = index_path or WIKIDATA_DAY_INDEX_FILE
+    tmp_path = index_path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    conn = sqlite3.connect(tmp_path)
+    conn.executescript(
+        """
+        PRAGMA journal_mode = OFF;
+        PRAGMA synchronous = OFF;
+        CREATE TABLE days (
+            ddmm TEXT NOT NULL,
+            type TEXT NOT NULL,
+            qid INTEGER NOT NULL,
+            PRIMARY KEY (ddmm, type, qid)
+        ) WITHOUT ROWID;
+        CREATE TABLE entities (
+            qid INTEGER PRIMARY KEY,
+            types TEXT NOT NULL
+        );
+        CREATE TABLE labels (
+            norm TEXT NOT NULL,
+            qid INTEGER NOT NULL,
+            PRIMARY KEY (qid, norm)
+        ) WITHOUT ROWID;
+        """
+    )
+
+    start = time.perf_counter()
+    seen = 0
+    day_rows = []
+    entity_rows = []
+    label_rows = []
+
+    def flush():
+        conn.executemany("INSERT OR IGNORE INTO days VALUES (?, ?, ?)", day_rows)
+        conn.executemany("INSERT OR REPLACE INTO entities VALUES (?, ?)", entity_rows)
+        conn.executemany("INSERT OR IGNORE INTO labels VALUES (?, ?)", label_rows)
+        conn.commit()
+        day_rows.clear()
+        entity_rows.clear()
+        label_rows.clear()
+
+    for path in sources:
+        for qid_num, dates, labels in _iter_day_index_source(path):
+            # Tipos para los que la fuente trae fechas: solo en esos el índice puede rechazar
+            types = [t for t, props in CANDIDATE_DATE_PROPS.items() if any(dates.get(p) for p in props)]
+            if not types:
+                continue
+            seen += 1
+            entity_rows.append((qid_num, ",".join(types)))
+            for cand_type in types:
+                ddmm, _, _ = candidate_ddmm_from_dates(cand_type, dates)
+                if ddmm:
+                    day_rows.append((ddmm, cand_type, qid_num))
+            label_rows.extend((norm, qid_num) for norm in labels if norm)
+            if len(entity_rows) >= batch_size:
+                flush()
+                print(f"📅 Índice por día: {seen} entidades con fecha.")
+
+    flush()
+    days = conn.execute("SELECT COUNT(DISTINCT ddmm), COUNT(*) FROM days").fetchone()
+    entities = conn.execute("SELECT COUNT(*) FROM entities").fetchone()[0]
+    conn.execute("VACUUM")
+    conn.close()
+    os.replace(tmp_path, index_path)
+    with _day_indexes_lock:
+        _day_indexes.clear()
+
+    print(
+        f"✅ Índice por día en {index_path}: {entities} entidades, {days[1]} fechas válidas "
+        f"en {days[0]} días ({time.perf_counter() - start:.1f} s)."
+    )
+    return entities
+
+
+def _day_index_conn():
+    """Conexión de solo lectura (una por hilo) al índice por día, o None si no existe."""
+    conn = getattr(_day_index_local, "conn", None)
+    if conn is None:
+        if not WIKIDATA_DAY_INDEX_FILE or not os.path.exists(WIKIDATA_DAY_INDEX_FILE):
+            return None
+        conn = sqlite3.connect(f"file:{WIKIDATA_DAY_INDEX_FILE}?mode=ro", uri=True)
+        _day_index_local.conn = conn
+    return conn
+
+
+class DayIndex:
+    """
+    Lo que el índice inverso sabe de un dd/mm: los QIDs que validan ese día por tipo
+    de candidato y sus labels normalizados. Comprobar una fecha es mirar si el QID
+    está en el conjunto de su tipo.
+    """
+
+    def __init__(self, ddmm, qids, labels):
+        self.ddmm = ddmm
+        self.qids = qids        # tipo → {"Q123", ...}
+        self.labels = labels    # label normalizado → {"Q123", ...}
+        self._types = {}        # QID → tipos con fecha en el índice (cualquier día)
+
+    @classmethod
+    def load(cls, ddmm):
+        conn = _day_index_conn()
+        if conn is None:
+            return None
+        qids = {cand_type: set() for cand_type in CANDIDATE_DATE_PROPS}
+        for cand_type, qid_num in conn.execute("SELECT type, qid FROM days WHERE ddmm = ?", (ddmm,)):
+            qids.setdefault(cand_type, set()).add(f"Q{qid_num}")
+        labels = {}
+        rows = conn.execute(
+            "SELECT l.norm, l.qid FROM labels l "
+            "WHERE l.qid IN (SELECT qid FROM days WHERE ddmm = ?)",
+            (ddmm,),
+        )
+        for norm, qid_num in rows:
+            labels.setdefault(norm, set()).add(f"Q{qid_num}")
+        return cls(ddmm, qids, labels)
+
+    def match(self, entity, cand_type):
+        """QID de ese día cuyo label coincide con la entidad y vale para el tipo, o None."""
+        for qid in sorted(self.labels.get(normalize_label(entity), ())):
+            if qid in self.qids.get(cand_type, ()):
+                return qid
+        return None
+
+    def verdict(self, qid, cand_type):
+        """
+        True si el QID valida ese día para el tipo, False si el índice tiene sus fechas
+        para ese tipo y no coinciden, None si no lo sabe (hay que mirar los claims).
+        """
+        if not qid:
+            return None
+        if qid in self.qids.get(cand_type, ()):
+            return True
+        if qid not in self._types:
+            conn = _day_index_conn()
+            row = conn.execute("SELECT types FROM entities WHERE qid = ?", (int(qid[1:]),)).fetchone()
+            self._types[qid] = set(row[0].split(",")) if row else set()
+        return False if cand_type in self._types[qid] else None
+
+
+def load_day_index(ddmm):
+    """DayIndex de un dd/mm (cargado una vez por ejecución), o None si no hay índice por día."""
+    with _day_indexes_lock:
+        if ddmm not in _day_indexes:
+            _day_indexes[ddmm] = DayIndex.load(ddmm)
+        return _day_indexes[ddmm]
+
+
+# ----------------- Resolución local de labels (sin wbsearchentities) ----------------- #
+
+# P31 de los seres humanos: los candidatos birth/death solo aceptan QIDs de personas
+WIKIDATA_HUMAN_QID = "Q5"
+
+_label_resolver = None
+_label_resolver_lock = threading.Lock()
+
+
+def normalize_label(label):
+    """Minúsculas, sin tildes ni signos y con los espacios colapsados."""
+    text = unicodedata.normalize("NFKD", label or "")
+    text = "".join(ch for ch in text if not unicodedata.combining(ch)).lower()
+    return " ".join(re.findall(r"\w+", text))
+
+
+# Palabras que distinguen entidades casi homónimas ("Primera/Segunda batalla de ...")
+_LABEL_ORDINALS = {
+    "primera", "primer", "primero", "segunda", "segundo", "tercera", "tercer", "tercero",
+    "cuarta", "cuarto", "quinta", "quinto", "sexta", "sexto", "septima", "septimo",
+    "octava", "octavo", "novena", "noveno", "decima", "decimo",
+    "i", "ii", "iii", "iv", "v", "vi", "vii", "viii", "ix", "x", "xi", "xii", "xiii", "xiv",
+}
+
+
+def _label_markers(norm):
+    """Números y ordinales del label: una coincidencia aproximada debe compartirlos todos."""
+    return frozenset(w for w in norm.split() if w.isdigit() or w in _LABEL_ORDINALS)
+
+
+def _label_trigrams(norm):
+    padded = f"  {norm} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class LabelResolver:
+    """
+    Resolutor local label → QID a partir de los labels y alias en español de los QIDs
+    ya consultados en Wikidata (persistidos en LABELS_DB_FILE). Coincidencia exacta
+    sobre el label normalizado y, si no la hay, aproximada por trigramas. Filtra por
+    tipo con P31: birth/death solo aceptan humanos y event no los acepta.
+    """
+
+    def __init__(self, path=None):
+        self.lock = threading.Lock()
+        self.conn = None
+        self.is_human = {}
+        self.exact = {}
+        self.entries = []
+        self.trigrams = {}
+        self.hits = 0
+        self.misses = 0
+
+        if path:
+            self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+            self.conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS entities (
+                    qid TEXT PRIMARY KEY,
+                    is_human INTEGER
+                );
+                CREATE TABLE IF NOT EXISTS labels (
+                    norm TEXT NOT NULL,
+                    qid TEXT NOT NULL,
+                    PRIMARY KEY (norm, qid)
+                );
+                """
+            )
+            for qid, is_human in self.conn.execute("SELECT qid, is_human FROM entities"):
+                self.is_human[qid] = None if is_human is None else bool(is_human)
+            for norm, qid in self.conn.execute("SELECT norm, qid FROM labels"):
+                self._index(norm, qid)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _index(self, norm, qid):
+        qids = self.exact.setdefault(norm, [])
+        if qid in qids:
+            return False
+        qids.append(qid)
+        idx = len(self.entries)
+        tris = _label_trigrams(norm)
+        self.entries.append((qid, len(tris), _label_markers(norm)))
+        for tri in tris:
+            self.trigrams.setdefault(tri, []).append(idx)
+        return True
+
+    def add(self, qid, labels, is_human=None):
+        """Registra labels/alias de un QID (is_human None = P31 desconocido)."""
+        rows = []
+        with self.lock:
+            if is_human is not None or qid not in self.is_human:
+                self.is_human[qid] = is_human
+            for label in labels:
+                norm = normalize_label(label)
+                if norm and self._index(norm, qid):
+                    rows.append((norm, qid))
+            if self.conn is not None:
+                self.conn.execute(
+                    "INSERT INTO entities (qid, is_human) VALUES (?, ?) "
+                    "ON CONFLICT(qid) DO UPDATE SET is_human = COALESCE(excluded.is_human, is_human)",
+                    (qid, None if is_human is None else int(is_human)),
+                )
+                self.conn.executemany("INSERT OR IGNORE INTO labels VALUES (?, ?)", rows)
+                self.conn.commit()
+
+    def _type_ok(self, qid, cand_type):
+        human = self.is_human.get(qid)
+        if human is None or cand_type not in ("event", "birth", "death"):
+            return True
+        return human == (cand_type in ("birth", "death"))
+
+    def resolve(self, label, cand_type=None):
+        """QID del label si hay una coincidencia local única y del tipo esperado; si no, None."""
+        norm = normalize_label(label)
+        if not norm:
+            return None
+
+        with self.lock:
+            exact = [q for q in self.exact.get(norm, []) if self._type_ok(q, cand_type)]
+            if len(exact) == 1:
+                self.hits += 1
+                return exact[0]
+            if exact:
+                # Homónimos del mismo tipo: mejor preguntar a la red
+                self.misses += 1
+                return None
+
+            tris = _label_trigrams(norm)
+            common = {}
+            for tri in tris:
+                for idx in self.trigrams.get(tri, ()):
+                    common[idx] = common.get(idx, 0) + 1
+
+            markers = _label_markers(norm)
+            best = {}
+            for idx, shared in common.items():
+                qid, size, entry_markers = self.entries[idx]
+                score = 2 * shared / (len(tris) + size)
+                if score < LABEL_MATCH_THRESHOLD or entry_markers != markers:
+                    continue
+                if self._type_ok(qid, cand_type):
+                    best[qid] = max(score, best.get(qid, 0))
+
+            ranked = sorted(best.items(), key=lambda item: -item[1])
+            if not ranked or (len(ranked) > 1 and ranked[1][1] == ranked[0][1]):
+                self.misses += 1
+                return None
+            self.hits += 1
+            return ranked[0][0]
+
+    def resolve_many(self, items):
+        """Resuelve en una pasada una ronda entera de (label, tipo); None donde no haya match."""
+        return [self.resolve(label, cand_type) for label, cand_type in items]
+
+
+def get_label_resolver():
+    """Resolutor de labels compartido (se carga de LABELS_DB_FILE la primera vez)."""
+    global _label_resolver
+    with _label_resolver_lock:
+        if _label_resolver is None:
+            _label_resolver = LabelResolver(LABELS_DB_FILE or None)
+        return _label_resolver
+
+
+def record_entity_labels(entities):
+    """Acumula los labels/alias en español y el P31 de entidades devueltas por wbgetentities."""
+    if not LABELS_DB_FILE:
+        return
+    resolver = get_label_resolver()
+    for entity in entities:
+        qid = entity.get("id")
+        if not qid or "missing" in entity:
+            continue
+        labels = []
+        label = entity.get("labels", {}).get("es", {}).get("value")
+        if label:
+            labels.append(label)
+        labels.extend(a["value"] for a in entity.get("aliases", {}).get("es", []) if a.get("value"))
+        if not labels:
+            continue
+        p31 = {
+            ((c.get("mainsnak", {}).get("datavalue") or {}).get("value") or {}).get("id")
+            for c in entity.get("claims", {}).get("P31", [])
+        }
+        resolver.add(qid, labels, is_human=WIKIDATA_HUMAN_QID in p31 if p31 else None)
+
+
+def resolve_entity_id(label, cand_type=None):
+    """QID de un candidato: primero el resolutor local y, si no hay match, wbsearchentities."""
+    if LABELS_DB_FILE:
+        qid = get_label_resolver().resolve(label, cand_type)
+        if qid:
+            return qid
+    return search_entity_id(label)
+
+
+def report_label_resolver():
+    """Imprime cuántos labels se resolvieron en local frente a los que fueron a la red."""
+    if _label_resolver is None or not (_label_resolver.hits or _label_resolver.misses):
+        return
+    print(
+        f"🏷️ Labels: {_label_resolver.hits} resueltos en local, "
+        f"{_label_resolver.misses} a wbsearchentities ({len(_label_resolver)} labels conocidos)."
+    )
+
+
+# ----------------- Diario de publicación (hilos en cola) ----------------- #
+
+# Estados de un hilo del diario: "queued" (nada publicado), "partial" (titular y quizá
+# algunas respuestas publicados), "done", "discarded" (no era su día) y "abandoned".
+# Un tuit con "uncertain" recibió un 5xx al publicarse: puede estar en X sin ID en el diario.
+JOURNAL_OPEN_STATUSES = ("queued", "partial")
+
+
+def _load_legacy_pending():
+    """Lee un pending_tweet.json del formato antiguo, si existe y es válido."""
+    if not os.path.exists(PENDING_FILE):
+        return None
+    try:
+        with open(PENDING_FILE, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        headline = data.get("headline")
+        followups = data.get("followups", [])
+        target_ddmm = data.get("target_ddmm")
+        if not isinstance(headline, str) or not headline.strip():
+            return None
+        if not isinstance(followups, list):
+            followups = []
+        followups = [str(t) for t in followups]
+        if not isinstance(target_ddmm, str):
+            target_ddmm = None
+        return {"headline": headline, "followups": followups, "target_ddmm": target_ddmm}
+    except Exception as e:
+        print("⚠️ Error leyendo pending_tweet.json:", e)
+        return None
+
+
+def _journal_entry(headline, followups, target_ddmm, target_date=None):
+    now = datetime.datetime.utcnow()
+    return {
+        "id": now.strftime("%Y%m%dT%H%M%S%f"),
+        "target_ddmm": target_ddmm,
+        "target_date": target_date.isoformat() if target_date else None,
+        "queued_at": now.isoformat() + "Z",
+        "status": "queued",
+        "failures": 0,
+        "tweets": [{"text": t, "tweet_id": None} for t in [headline] + list(followups or [])],
+    }
+
+
+def load_publish_journal():
+    """Carga el diario de publicación y migra a él un pending_tweet.json antiguo si lo hay."""
+    journal = {"threads": []}
+    if os.path.exists(PUBLISH_JOURNAL_FILE):
+        try:
+            with open(PUBLISH_JOURNAL_FILE, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if isinstance(data, dict) and isinstance(data.get("threads"), list):
+                journal = data
+        except Exception as e:
+            print("⚠️ Error leyendo el diario de publicación:", e)
+
+    legacy = _load_legacy_pending()
+    if legacy:
+        journal["threads"].append(
+            _journal_entry(legacy["headline"], legacy["followups"], legacy["target_ddmm"])
+        )
+        save_publish_journal(journal)
+        os.remove(PENDING_FILE)
+        print("📦 pending_tweet.json migrado al diario de publicación.")
+    return journal
+
+
+def save_publish_journal(journal):
+    """Guarda el diario (escritura atómica) olvidando los hilos cerrados de hace más de PUBLISH_JOURNAL_KEEP_DAYS."""
+    cutoff = (today_date() - datetime.timedelta(days=PUBLISH_JOURNAL_KEEP_DAYS)).isoformat()
+    journal["threads"] = [
+        t for t in journal["threads"]
+        if t.get("status") in JOURNAL_OPEN_STATUSES
+        or (t.get("target_date") or t.get("queued_at", "")[:10]) >= cutoff
+    ]
+    write_json_atomic(PUBLISH_JOURNAL_FILE, journal, indent=2)
+
+
+def enqueue_thread(journal, headline, followups, target_ddmm, target_date=None):
+    """Añade un hilo al diario y lo guarda antes de publicar nada."""
+    entry = _journal_entry(headline, followups, target_ddmm, target_date)
+    journal["threads"].append(entry)
+    save_publish_journal(journal)
+    return entry
+
+
+def journal_published_on(target_date):
+    """
+    True si el diario ya tiene un hilo con el titular publicado para esa fecha, sea
+    cual sea su estado (un hilo abandonado a medias también cuenta).
+    """
+    day = target_date.isoformat()
+    return any(
+        t.get("target_date") == day and t.get("tweets") and t["tweets"][0].get("tweet_id")
+        for t in load_publish_journal()["threads"]
+    )
+
+
+# ----------------- Historial local del timeline (SQLite) ----------------- #
+
+# Titular publicado: "🇪🇸 {día} de {mes} de {año}: ..."
+HEADLINE_DATE_RE = re.compile(r"^\s*🇪🇸\s*(\d{1,2}) de ([a-záéíóú]+) de (\d{4})", re.IGNORECASE)
+
+
+def headline_ddmm(text):
+    """dd/mm declarado en un titular del bot, o None si el texto no es un titular."""
+    match = HEADLINE_DATE_RE.match(text or "")
+    if not match:
+        return None
+    month_name = match.group(2).lower()
+    if month_name not in MONTH_NAMES[1:]:
+        return None
+    return f"{int(match.group(1)):02d}/{MONTH_NAMES.index(month_name):02d}"
+
+
+def _published_ddmm(created_at):
+    if created_at is None:
+        return None
+    if isinstance(created_at, str):
+        try:
+            created_at = datetime.datetime.fromisoformat(created_at.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=datetime.timezone.utc)
+    local = created_at.astimezone(pytz.timezone(TZ))
+    return f"{local.day:02d}/{local.month:02d}"
+
+
+def open_timeline_db(path=None):
+    """Abre (y crea si hace falta) la base de datos local con los tuits publicados."""
+    conn = sqlite3.connect(path or TIMELINE_DB_FILE)
+    conn.executescript(
+        """
+        CREATE TABLE IF NOT EXISTS tweets (
+            id INTEGER PRIMARY KEY,
+            created_at TEXT,
+            text TEXT NOT NULL,
+            headline_ddmm TEXT,
+            published_ddmm TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_tweets_headline_ddmm ON tweets (headline_ddmm);
+        CREATE INDEX IF NOT EXISTS idx_tweets_published_ddmm ON tweets (published_ddmm);
+        CREATE TABLE IF NOT EXISTS sync_state (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+        """
+    )
+    return conn
+
+
+def _sync_state(conn, key):
+    row = conn.execute("SELECT value FROM sync_state WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+
+def _set_sync_state(conn, key, value):
+    conn.execute(
+        "INSERT INTO sync_state (key, value) VALUES (?, ?) "
+        "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+        (key, str(value)),
+    )
+
+
+def store_tweets(conn, tweets):
+    """Guarda tuits (dicts con id, text y created_at) ignorando los ya existentes."""
+    rows = []
+    for t in tweets:
+        created_at = t.get("created_at")
+        if isinstance(created_at, datetime.datetime):
+            created_at = created_at.isoformat()
+        rows.append((
+            int(t["id"]),
+            created_at,
+            t["text"],
+            headline_ddmm(t["text"]),
+            _published_ddmm(created_at),
+        ))
+    conn.executemany(
+        "INSERT OR IGNORE INTO tweets (id, created_at, text, headline_ddmm, published_ddmm) "
+        "VALUES (?, ?, ?, ?, ?)",
+        rows,
+    )
+    conn.commit()
+    return len(rows)
+
+
+def _fetch_timeline_pages(cli, since_id=None, until_id=None, max_pages=1):
+    """
+    Pagina get_users_tweets y devuelve (tuits, completo, id_más_reciente).
+    completo=False si se agotaron las páginas o hubo un error a mitad.
+    """
+    tweets = []
+    newest_id = None
+    token = None
+    for _ in range(max_pages):
+        try:
+            resp = cli.get_users_tweets(
+                id=TWITTER_USER_ID,
+                max_results=100,
+                since_id=since_id,
+                until_id=until_id,
+                pagination_token=token,
+                tweet_fields=["created_at", "text"],
+            )
+        except tweepy.errors.TooManyRequests:
+            print("⚠️ Rate limit X (429) sincronizando el timeline. Se usa el historial local.")
+            return tweets, False, newest_id
+        except Exception as e:
+            print("⚠️ Error sincronizando el timeline:", e)
+            return tweets, False, newest_id
+
+        meta = resp.meta or {}
+        if newest_id is None and meta.get("newest_id"):
+            newest_id = meta["newest_id"]
+        for t in resp.data or []:
+            tweets.append({"id": t.id, "text": t.text, "created_at": t.created_at})
+
+        token = meta.get("next_token")
+        if not token:
+            return tweets, True, newest_id
+
+    return tweets, False, newest_id
+
+
+def sync_timeline(conn):
+    """
+    Sincroniza incrementalmente el historial local con X: primero lo nuevo desde el
+    último since_id completo y, mientras no se haya llegado al principio de la cuenta,
+    un tramo más de tuits antiguos (until_id).
+    """
+    if not TW_BEARER_TOKEN:
+        return
+
+    cli = tweepy.Client(bearer_token=TW_BEARER_TOKEN)
+
+    since_id = _sync_state(conn, "newest_id")
+    tweets, complete, newest_id = _fetch_timeline_pages(
+        cli, since_id=since_id, max_pages=TIMELINE_SYNC_MAX_PAGES
+    )
+    store_tweets(conn, tweets)
+    # Solo se avanza since_id si no ha quedado un hueco sin leer
+    if newest_id and (complete or not since_id):
+        _set_sync_state(conn, "newest_id", newest_id)
+
+    if _sync_state(conn, "backfill_done") != "1":
+        oldest = conn.execute("SELECT MIN(id) FROM tweets").fetchone()[0]
+        if oldest is not None:
+            older, complete_older, _ = _fetch_timeline_pages(
+                cli, until_id=oldest, max_pages=TIMELINE_SYNC_MAX_PAGES
+            )
+            store_tweets(conn, older)
+            tweets += older
+            if complete_older:
+                _set_sync_state(conn, "backfill_done", "1")
+
+    conn.commit()
+    if tweets:
+        print(f"🗄️ Timeline: {len(tweets)} tuits nuevos en el historial local.")
+
+
+def record_published_tweet(tweet_id, text):
+    """Añade al historial local un tuit recién publicado (aunque luego falle la sincronización)."""
+    if not TIMELINE_DB_FILE or not tweet_id:
+        return
+    try:
+        conn = open_timeline_db()
+        try:
+            store_tweets(conn, [{
+                "id": tweet_id,
+                "text": text,
+                "created_at": datetime.datetime.now(datetime.timezone.utc),
+            }])
+        finally:
+            conn.close()
+    except Exception as e:
+        print("⚠️ No se pudo guardar el tuit en el historial local:", e)
+
+
+# ----------------- Anti-repetición (timeline X) ----------------- #
+
+def fetch_previous_events_same_day(month, day, sync=True):
+    """
+    Devuelve (en minúsculas) los titulares ya publicados para el mismo dd/mm
+    en cualquier año. Sincroniza el historial local con X y lo consulta por
+    dd/mm; si X da 429, se sigue usando lo que ya hay guardado.
+    Con sync=False solo se mira el historial local (sin llamadas a X).
+    """
+    if not TIMELINE_DB_FILE:
+        return _fetch_recent_same_day_from_api(day) if sync else []
+
+    ddmm = f"{day:02d}/{month:02d}"
+    try:
+        conn = open_timeline_db()
+    except Exception as e:
+        print("⚠️ No se pudo abrir el historial local del timeline:", e)
+        return _fetch_recent_same_day_from_api(day)
+
+    try:
+        if sync:
+            sync_timeline(conn)
+        rows = conn.execute(
+            "SELECT text FROM tweets WHERE headline_ddmm = ?", (ddmm,)
+        ).fetchall()
+        total = conn.execute("SELECT COUNT(*) FROM tweets").fetchone()[0]
+    finally:
+        conn.close()
+
+    print(f"🗄️ Anti-repetición: {len(rows)} titulares del {ddmm} en un historial de {total} tuits.")
+    return [row[0].lower() for row in rows]
+
+
+def _fetch_recent_same_day_from_api(day):
+    """
+    Lee solo los últimos tuits del usuario y detecta titulares del mismo día
+    (para no repetir efemérides). Usa UNA sola llamada para evitar 429.
+    Si hay rate limit (429) u otro error, devolvemos [] y no rompemos nada.
+    """
+    if not TW_BEARER_TOKEN:
+        return []
 
     cli = tweepy.Client(bearer_token=TW_BEARER_TOKEN)
     search_prefix = f"🇪🇸 {day} de "
@@ -402,28 +2181,60 @@ def fetch_previous_events_same_day(month, day):
     return old_texts
 
 
-def event_is_repeated(event_text, old_texts):
+# Grupos de KEYWORD_GROUPS cuyos tokens cuentan como fragmentos clave
+REPETITION_KEY_GROUPS = ("spanish_actor", "spanish_wide", "military", "diplomatic")
+
+
+def _key_fragments(text):
+    hits = match_keywords(text.lower())
+    fragments = set()
+    for group in REPETITION_KEY_GROUPS:
+        fragments.update(hits.get(group, ()))
+    return fragments
+
+
+class RepetitionIndex:
     """
-    Comprueba si un evento ya fue tratado comparando tokens clave.
+    Índice de anti-repetición construido una vez por ejecución a partir de old_texts:
+    el conjunto de fragmentos clave de cada tuit previo y un índice invertido
+    fragmento → tuits que lo contienen.
     """
-    t = event_text.lower()
 
-    key_fragments = (
-        SPANISH_ACTOR_TOKENS +
-        SPANISH_WIDE_TOKENS +
-        MILITARY_KEYWORDS +
-        DIPLO_KEYWORDS
-    )
+    def __init__(self, old_texts=()):
+        self.fragments = []
+        self.inverted = {}
+        for text in old_texts:
+            self.add(text)
+
+    def add(self, text):
+        idx = len(self.fragments)
+        fragments = _key_fragments(text)
+        self.fragments.append(fragments)
+        for frag in fragments:
+            self.inverted.setdefault(frag, []).append(idx)
+
+    def __len__(self):
+        return len(self.fragments)
+
+    def is_repeated(self, event_text, min_matches=2):
+        """True si algún tuit previo comparte al menos min_matches fragmentos con el texto."""
+        counts = {}
+        for frag in _key_fragments(event_text):
+            for idx in self.inverted.get(frag, ()):
+                counts[idx] = counts.get(idx, 0) + 1
+                if counts[idx] >= min_matches:
+                    return True
+        return False
 
-    for prev in old_texts:
-        matches = 0
-        for k in key_fragments:
-            if k in t and k in prev:
-                matches += 1
-        if matches >= 2:
-            return True
 
-    return False
+def event_is_repeated(event_text, old_texts):
+    """
+    Comprueba si un evento ya fue tratado comparando tokens clave.
+    old_texts puede ser una lista de textos o un RepetitionIndex ya construido.
+    """
+    if not isinstance(old_texts, RepetitionIndex):
+        old_texts = RepetitionIndex(old_texts)
+    return old_texts.is_repeated(event_text)
 
 
 # ----------------- Anti-contradicciones (hilo) ----------------- #
@@ -454,7 +2265,8 @@ Devuelve EXCLUSIVAMENTE un JSON con la siguiente forma:
 No añadas nada más.
 """
 
-    resp = client.chat.completions.create(
+    raw = openai_chat(
+        "contradictions",
         model="gpt-4.1-mini",
         messages=[
             {"role": "system", "content": "Corrige contradicciones internas respetando el estilo original y la efeméride proporcionada."},
@@ -463,9 +2275,7 @@ No añadas nada más.
         temperature=0.2,
         max_tokens=800,
         response_format={"type": "json_object"},
-    )
-
-    raw = resp.choices[0].message.content.strip()
+    ).strip()
     try:
         raw_clean = clean_json_from_markdown(raw)
         data = json.loads(raw_clean)
@@ -482,29 +2292,81 @@ No añadas nada más.
 
 # ----------------- Utilidades de fecha ----------------- #
 
+MONTH_NAMES = [
+    "", "enero", "febrero", "marzo", "abril", "mayo", "junio",
+    "julio", "agosto", "septiembre", "octubre", "noviembre", "diciembre"
+]
+
+
+def date_info(date):
+    """Devuelve (año, mes, día, nombre_mes) para una fecha concreta."""
+    return date.year, date.month, date.day, MONTH_NAMES[date.month]
+
+
 def today_info():
     """Devuelve (año, mes, día, nombre_mes) en Europa/Madrid."""
     tz = pytz.timezone(TZ)
     now = datetime.datetime.now(tz)
-    year = now.year
-    month = now.month
-    day = now.day
+    return date_info(now.date())
 
-    meses = [
-        "", "enero", "febrero", "marzo", "abril", "mayo", "junio",
-        "julio", "agosto", "septiembre", "octubre", "noviembre", "diciembre"
-    ]
-    month_name = meses[month]
-    return year, month, day, month_name
+
+def today_date():
+    """Fecha de hoy en Europa/Madrid."""
+    return datetime.datetime.now(pytz.timezone(TZ)).date()
+
+
+def next_occurrence(month, day, start=None):
+    """Próxima fecha (hoy incluido) con ese día y mes; para el 29/02, el siguiente año bisiesto."""
+    start = start or today_date()
+    year = start.year
+    while True:
+        try:
+            date = datetime.date(year, month, day)
+        except ValueError:
+            year += 1
+            continue
+        if date >= start:
+            return date
+        year += 1
+
+
+def parse_ddmm(value):
+    """Convierte "dd/mm" en (mes, día). Lanza ValueError si no es una fecha del calendario."""
+    match = re.match(r"^\s*(\d{1,2})/(\d{1,2})\s*$", value or "")
+    if not match:
+        raise ValueError(f"fecha dd/mm no válida: {value!r}")
+    day, month = int(match.group(1)), int(match.group(2))
+    datetime.date(2000, month, day)  # 2000 es bisiesto: admite el 29/02
+    return month, day
+
+
+def ddmm_range(from_ddmm=None, to_ddmm=None):
+    """
+    Lista de (mes, día) entre dos dd/mm, ambos incluidos, 29/02 incluido.
+    Sin límites devuelve los 366 días del año. Si to < from, da la vuelta al año.
+    """
+    all_days = []
+    date = datetime.date(2000, 1, 1)
+    while date.year == 2000:
+        all_days.append((date.month, date.day))
+        date += datetime.timedelta(days=1)
+
+    start = all_days.index(parse_ddmm(from_ddmm)) if from_ddmm else 0
+    end = all_days.index(parse_ddmm(to_ddmm)) if to_ddmm else len(all_days) - 1
+    if end >= start:
+        return all_days[start:end + 1]
+    return all_days[start:] + all_days[:end + 1]
 
 
 # ----------------- Scrapers web (ya no usados en main, se dejan por si acaso) ----------------- #
 
 def fetch_hoyenlahistoria_events():
+    from bs4 import BeautifulSoup
+
     url = "https://www.hoyenlahistoria.com/efemerides.php"
     headers = {"User-Agent": USER_AGENT}
 
-    resp = requests.get(url, headers=headers, timeout=25)
+    resp = http_get(url, headers=headers, timeout=25)
     resp.raise_for_status()
 
     soup = BeautifulSoup(resp.text, "html.parser")
@@ -543,6 +2405,8 @@ def fetch_hoyenlahistoria_events():
 
 
 def fetch_nuestrahistoria_events_for_today(today_day, today_month_name):
+    from bs4 import BeautifulSoup
+
     headers = {"User-Agent": USER_AGENT}
     events = []
     month = today_month_name.lower()
@@ -561,7 +2425,7 @@ def fetch_nuestrahistoria_events_for_today(today_day, today_month_name):
 
     for url in urls:
         try:
-            resp = requests.get(url, headers=headers, timeout=25)
+            resp = http_get(url, headers=headers, timeout=25)
             resp.raise_for_status()
         except Exception as e:
             print(f"⚠️ Error accediendo a {url}:", e)
@@ -588,6 +2452,8 @@ def fetch_nuestrahistoria_events_for_today(today_day, today_month_name):
 
 
 def fetch_espanaenlahistoria_events_for_today(today_day, today_month_name):
+    from bs4 import BeautifulSoup
+
     headers = {"User-Agent": USER_AGENT}
     events = []
     month = today_month_name.lower()
@@ -607,7 +2473,7 @@ def fetch_espanaenlahistoria_events_for_today(today_day, today_month_name):
 
     for url in urls:
         try:
-            resp = requests.get(url, headers=headers, timeout=25)
+            resp = http_get(url, headers=headers, timeout=25)
             resp.raise_for_status()
         except Exception as e:
             print(f"⚠️ Error accediendo a {url}:", e)
@@ -639,10 +2505,10 @@ def fetch_espanaenlahistoria_events_for_today(today_day, today_month_name):
 
 # ----------------- NUEVO: fuente principal → OpenAI (lista de efemérides) ----------------- #
 
-def fetch_openai_events_for_today(today_year, today_month, today_day, today_month_name):
+def _candidates_request(today_year, today_day, today_month_name, exclude=()):
     """
-    Pide a OpenAI una lista de efemérides del día centradas en España / Imperio,
-    devuelve lista de dicts con: year, text, raw, source="openai".
+    Argumentos de chat.completions para pedir las efemérides candidatas de un día.
+    exclude: entidades ya propuestas en rondas anteriores, que no deben repetirse.
     """
     today_str = f"{today_day} de {today_month_name} de {today_year}"
 
@@ -681,8 +2547,13 @@ FORMATO DE RESPUESTA (OBLIGATORIO):
 
 No añadas comentarios fuera del JSON.
 """
+    if exclude:
+        prompt += (
+            "\nYa se han propuesto (y descartado) estas entidades; NO las repitas, "
+            "ni con otro nombre:\n" + "\n".join(f"- {name}" for name in exclude) + "\n"
+        )
 
-    completion = client.chat.completions.create(
+    return dict(
         model="gpt-4.1-mini",
         messages=[
             {
@@ -699,7 +2570,54 @@ No añadas comentarios fuera del JSON.
         response_format={"type": "json_object"},
     )
 
-    raw = completion.choices[0].message.content.strip()
+
+def _parse_candidate_item(item):
+    """Pasa un elemento de "events" a candidato {year, type, entity, text, raw, source}, o None."""
+    if not isinstance(item, dict):
+        return None
+    year = item.get("year")
+    cand_type = item.get("type")
+    entity = item.get("entity")
+    desc = (
+        item.get("text")
+        or item.get("description")
+        or item.get("texto")
+    )
+    try:
+        year_int = int(year)
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(desc, str):
+        return None
+    if cand_type not in {"event", "birth", "death"}:
+        return None
+    if not isinstance(entity, str) or not entity.strip():
+        return None
+    desc = desc.strip()
+    if not desc:
+        return None
+    return {
+        "year": year_int,
+        "type": cand_type,
+        "entity": entity.strip(),
+        "text": desc,
+        "raw": desc,
+        "source": "openai",
+    }
+
+
+def fetch_openai_events_for_today(today_year, today_month, today_day, today_month_name, attempt=1, exclude=()):
+    """
+    Pide a OpenAI una lista de efemérides del día centradas en España / Imperio,
+    devuelve lista de dicts con: year, text, raw, source="openai".
+    attempt separa en la caché de respuestas las distintas rondas del mismo día;
+    exclude son entidades de rondas anteriores que el modelo no debe repetir.
+    """
+    raw = openai_chat(
+        "candidates",
+        cache_scope=f"ronda-{attempt}",
+        **_candidates_request(today_year, today_day, today_month_name, exclude),
+    ).strip()
 
     events = []
     try:
@@ -714,37 +2632,9 @@ No añadas comentarios fuera del JSON.
 
         if isinstance(items, list):
             for item in items:
-                if not isinstance(item, dict):
-                    continue
-                year = item.get("year")
-                cand_type = item.get("type")
-                entity = item.get("entity")
-                desc = (
-                    item.get("text")
-                    or item.get("description")
-                    or item.get("texto")
-                )
-                try:
-                    year_int = int(year)
-                except (TypeError, ValueError):
-                    continue
-                if not isinstance(desc, str):
-                    continue
-                if cand_type not in {"event", "birth", "death"}:
-                    continue
-                if not isinstance(entity, str) or not entity.strip():
-                    continue
-                desc = desc.strip()
-                if not desc:
-                    continue
-                events.append({
-                    "year": year_int,
-                    "type": cand_type,
-                    "entity": entity.strip(),
-                    "text": desc,
-                    "raw": desc,
-                    "source": "openai",
-                })
+                ev = _parse_candidate_item(item)
+                if ev:
+                    events.append(ev)
     except Exception as e:
         print(f"⚠️ No se ha podido parsear el JSON de efemérides desde OpenAI: {e}")
         print("Contenido bruto devuelto por OpenAI:")
@@ -753,8 +2643,90 @@ No añadas comentarios fuera del JSON.
     return events
 
 
+def stream_openai_events_for_today(today_year, today_month, today_day, today_month_name, attempt=1, exclude=()):
+    """
+    Igual que fetch_openai_events_for_today, pero en streaming: genera cada candidato
+    en cuanto su objeto del array "events" llega completo, sin esperar al resto.
+    """
+    chunks = openai_chat_stream(
+        "candidates",
+        cache_scope=f"ronda-{attempt}",
+        **_candidates_request(today_year, today_day, today_month_name, exclude),
+    )
+    try:
+        for item in iter_json_array_items(chunks):
+            ev = _parse_candidate_item(item)
+            if ev:
+                yield ev
+        # Lo que queda tras el array ("]}" y el uso de tokens) cierra la llamada
+        for _ in chunks:
+            pass
+    finally:
+        chunks.close()
+
+
 # ----------------- Scoring “imperial” ----------------- #
 
+# Palabras: secuencias alfanuméricas, admitiendo puntos internos ("ee.uu")
+_WORD_RE = re.compile(r"\w+(?:\.\w+)*")
+
+
+def _build_keyword_index():
+    """
+    Indexa cada token (y sus KEYWORD_FORMS) por su tupla de palabras → [(grupo, token)].
+    También guarda los prefijos para cortar pronto al recorrer n-gramas.
+    """
+    index = {}
+    prefixes = set()
+    max_words = 1
+    for group, tokens in KEYWORD_GROUPS.items():
+        for token in tokens:
+            for form in [token] + KEYWORD_FORMS.get(token, []):
+                words = tuple(_WORD_RE.findall(form.lower()))
+                if not words:
+                    continue
+                index.setdefault(words, []).append((group, token))
+                for n in range(1, len(words)):
+                    prefixes.add(words[:n])
+                max_words = max(max_words, len(words))
+    return index, prefixes, max_words
+
+
+_KEYWORD_INDEX, _KEYWORD_PREFIXES, _KEYWORD_MAX_WORDS = _build_keyword_index()
+
+
+def _plural_variants(word):
+    """La palabra tal cual y sus posibles singulares (-s / -es)."""
+    variants = [word]
+    if word.endswith("es") and len(word) > 4:
+        variants.append(word[:-2])
+    if word.endswith("s") and len(word) > 3:
+        variants.append(word[:-1])
+    return variants
+
+
+def match_keywords(t_low):
+    """
+    Devuelve {grupo: set(tokens)} con todos los tokens de KEYWORD_GROUPS presentes
+    en el texto (ya en minúsculas). Recorre el texto una sola vez y compara palabras
+    completas (admitiendo plural en la última palabra), así "radio" no casa con "radiografía".
+    """
+    words = _WORD_RE.findall(t_low)
+    hits = {}
+    n_words = len(words)
+
+    for i in range(n_words):
+        for n in range(1, min(_KEYWORD_MAX_WORDS, n_words - i) + 1):
+            head = tuple(words[i:i + n - 1])
+            for variant in _plural_variants(words[i + n - 1]):
+                for group, token in _KEYWORD_INDEX.get(head + (variant,), ()):
+                    hits.setdefault(group, set()).add(token)
+            if tuple(words[i:i + n]) not in _KEYWORD_PREFIXES:
+                break
+
+    return hits
+
+
 def compute_score(ev):
     text = ev["text"]
     t_low = text.lower()
@@ -762,13 +2734,15 @@ def compute_score(ev):
 
     score = 0.0
 
-    has_spanish_actor = any(tok in t_low for tok in SPANISH_ACTOR_TOKENS)
-    has_spanish_wide = any(tok in t_low for tok in SPANISH_WIDE_TOKENS)
-    has_spanish_theatre = any(tok in t_low for tok in SPANISH_THEATRE_TOKENS)
+    hits = match_keywords(t_low)
 
-    has_military = any(kw in t_low for kw in MILITARY_KEYWORDS)
-    has_diplomatic = any(kw in t_low for kw in DIPLO_KEYWORDS)
-    has_foreign = any(tok in t_low for tok in FOREIGN_TOKENS)
+    has_spanish_actor = "spanish_actor" in hits
+    has_spanish_wide = "spanish_wide" in hits
+    has_spanish_theatre = "spanish_theatre" in hits
+
+    has_military = "military" in hits
+    has_diplomatic = "diplomatic" in hits
+    has_foreign = "foreign" in hits
 
     if has_spanish_actor:
         score += 35
@@ -785,9 +2759,7 @@ def compute_score(ev):
     if has_diplomatic:
         score += 8
 
-    for kw in CULTURE_LOW_PRIORITY:
-        if kw in t_low:
-            score -= 12
+    score -= 12 * len(hits.get("culture", ()))
 
     if 1400 <= year <= 1899:
         score += 5
@@ -809,6 +2781,8 @@ def choose_best_event(events, old_texts):
     Elige el evento con mayor score según compute_score, evitando repetidos.
     """
     candidates = []
+    if not isinstance(old_texts, RepetitionIndex):
+        old_texts = RepetitionIndex(old_texts)
 
     for ev in events:
         if event_is_repeated(ev["text"], old_texts):
@@ -823,37 +2797,367 @@ def choose_best_event(events, old_texts):
     return best
 
 
-def choose_best_verified_event(events, old_texts, today_ddmm):
+class CandidateRegistry:
+    """
+    Candidatos de todas las rondas de generación de un mismo día. Deduplica por
+    (entidad normalizada, tipo, año), recuerda el QID de cada entidad consultada y el
+    veredicto de Wikidata, y da las entidades descartadas para excluirlas en el prompt
+    de la ronda siguiente. Un candidato que llegó pero no se llegó a validar (la ronda
+    falló a mitad, p. ej.) no cuenta como visto: si vuelve, se valida.
+    """
+
+    def __init__(self):
+        self.verdicts = {}   # clave → True / False (None: sin validar)
+        self.qids = {}       # (entidad normalizada, tipo) → QID encontrado en Wikidata
+        self.entities = {}   # entidad normalizada → nombre tal como lo dio el modelo
+        self.duplicates = 0
+        self._round = set()  # claves admitidas en la ronda en curso
+
+    @staticmethod
+    def key(ev):
+        return normalize_label(ev["entity"]), ev["type"], ev["year"]
+
+    def begin_round(self):
+        self._round = set()
+
+    def admit(self, ev):
+        """Registra el candidato; False si ya salió en esta ronda o ya tiene veredicto."""
+        key = self.key(ev)
+        if key in self._round or self.verdicts.get(key) is not None:
+            self.duplicates += 1
+            return False
+        self._round.add(key)
+        self.verdicts.setdefault(key, None)
+        self.entities.setdefault(key[0], ev["entity"])
+        return True
+
+    def admit_many(self, events):
+        return [ev for ev in events if self.admit(ev)]
+
+    def record(self, ev, qid, valid):
+        """Anota el veredicto de un candidato; valid=None (fallo de Wikidata) lo deja sin validar."""
+        self.verdicts[self.key(ev)] = valid
+        if qid:
+            # Un "sin QID" puede ser un fallo de red: esa búsqueda se repite
+            self.qids[normalize_label(ev["entity"]), ev["type"]] = qid
+
+    def known_qid(self, entity, cand_type):
+        """
+        Future ya resuelto con (QID, False) de una entidad consultada en otra ronda con
+        el mismo tipo (el tipo decide el QID, p. ej. el filtro de humanos), o None.
+        """
+        key = (normalize_label(entity), cand_type)
+        if key not in self.qids:
+            return None
+        future = Future()
+        future.set_result((self.qids[key], False))
+        return future
+
+    def lookups(self, candidates):
+        """{(entidad, tipo): Future} de los candidatos que ya se buscaron en Wikidata."""
+        found = {}
+        for ev in candidates:
+            future = self.known_qid(ev["entity"], ev["type"])
+            if future:
+                found[ev["entity"], ev["type"]] = future
+        return found
+
+    def exclusions(self, limit=None):
+        """Entidades descartadas por Wikidata, las más recientes primero (como mucho CANDIDATE_EXCLUDE_MAX)."""
+        limit = CANDIDATE_EXCLUDE_MAX if limit is None else limit
+        rejected = dict.fromkeys(
+            self.entities[key[0]] for key, valid in reversed(self.verdicts.items()) if valid is False
+        )
+        return list(rejected)[:max(0, limit)]
+
+    def stats(self):
+        verdicts = list(self.verdicts.values())
+        return {
+            "candidates": len(verdicts),
+            "duplicates": self.duplicates,
+            "validated": sum(v is not None for v in verdicts),
+            "rejected": sum(v is False for v in verdicts),
+        }
+
+
+def choose_best_verified_event(events, old_texts, today_ddmm, registry=None):
     """
     Elige el mejor evento por score y lo valida con Wikidata,
     siguiendo el orden editorial de tipos: event → birth → death.
-    Si no pasa validación, prueba el siguiente.
+    Si no pasa validación, prueba el siguiente. Con registry, los QIDs ya
+    consultados en rondas anteriores no se vuelven a buscar y los veredictos se anotan.
     """
-    type_order = ("event", "birth", "death")
+    candidates = rank_candidates(events, old_texts)
+    if not candidates:
+        return None
+
+    lookups = registry.lookups(candidates) if registry else None
+    return _first_valid_candidate(candidates, today_ddmm, lookups, registry)
 
-    for cand_type in type_order:
-        candidates = []
-        for ev in events:
-            if ev.get("type") != cand_type:
+
+def choose_best_streamed_event(today_year, today_month, today_day, today_month_name, old_texts, attempt=1,
+                               registry=None):
+    """
+    Ronda de generación en streaming: de cada candidato no repetido se busca el QID en
+    cuanto llega, mientras el modelo sigue escribiendo el resto. Al cerrarse el stream
+    se ordenan y validan como en choose_best_verified_event (claims en lote), pero con
+    las búsquedas ya hechas o en curso. Con registry, los candidatos de rondas anteriores
+    se descartan al llegar y se pide al modelo que no repita sus entidades.
+    Devuelve (candidatos nuevos, mejor evento o None).
+    """
+    today_ddmm = f"{today_day:02d}/{today_month:02d}"
+    if not isinstance(old_texts, RepetitionIndex):
+        old_texts = RepetitionIndex(old_texts)
+
+    pool = ThreadPoolExecutor(max_workers=max(1, WIKIDATA_MAX_WORKERS))
+    events = []
+    lookups = {}
+    exclude = registry.exclusions() if registry else ()
+    try:
+        for ev in stream_openai_events_for_today(
+            today_year, today_month, today_day, today_month_name, attempt, exclude
+        ):
+            if registry and not registry.admit(ev):
                 continue
-            if event_is_repeated(ev["text"], old_texts):
+            events.append(ev)
+            key = (ev["entity"], ev["type"])
+            if key in lookups or event_is_repeated(ev["text"], old_texts):
                 continue
-            compute_score(ev)
-            candidates.append(ev)
+            known = registry.known_qid(*key) if registry else None
+            lookups[key] = known or pool.submit(
+                _with_failure_flag, resolve_entity_id, ev["entity"], ev["type"]
+            )
 
-        if not candidates:
-            continue
+        candidates = rank_candidates(events, old_texts)
+        best = _first_valid_candidate(candidates, today_ddmm, lookups, registry) if candidates else None
+        return events, best
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _first_valid_candidate(candidates, today_ddmm, lookups=None, registry=None):
+    """
+    Devuelve el primer candidato (en el orden recibido) que valida en Wikidata.
+    Al cerrar el generador se cancelan las búsquedas que queden pendientes.
+    """
+    valid = _iter_valid_candidates(candidates, today_ddmm, lookups, registry)
+    try:
+        return next(valid, None)
+    finally:
+        valid.close()
 
-        candidates.sort(key=lambda e: e["score"], reverse=True)
 
+def _iter_valid_candidates(candidates, today_ddmm, lookups=None, registry=None):
+    """
+    Genera, en el orden recibido, los candidatos que validan en Wikidata
+    (añadiendo su "qid"). Las búsquedas de QID se lanzan en paralelo (máximo
+    WIKIDATA_MAX_WORKERS a la vez), pero los veredictos se consumen en orden, así que
+    el resultado es el mismo que validando en serie. Los claims de los QIDs ya
+    resueltos se piden en lote. lookups ({(entidad, tipo): Future de (QID, falló)}, ver
+    _with_failure_flag) son búsquedas ya lanzadas, p. ej. mientras llegaba el stream
+    de candidatos. Los veredictos se anotan en registry (CandidateRegistry), si se
+    pasa; un descarte por un error de Wikidata queda sin veredicto. Con índice por día, los
+    candidatos cuyo label está entre las entidades de hoy no van a Wikidata y la
+    fecha de los QIDs indexados se comprueba en el índice en vez de en sus claims.
+    """
+    day_index = load_day_index(today_ddmm)
+    lookups = dict(lookups or {})
+    if day_index:
         for ev in candidates:
-            if validate_candidate_with_wikidata(ev, today_ddmm):
-                return ev
-            print(f"⚠️ Evento descartado por Wikidata: {ev['text']}")
+            key = (ev.get("entity"), ev.get("type"))
+            if key in lookups:
+                continue
+            qid = day_index.match(*key)
+            if qid:
+                future = Future()
+                future.set_result((qid, False))
+                lookups[key] = future
+
+    pool = ThreadPoolExecutor(max_workers=max(1, WIKIDATA_MAX_WORKERS))
+    pending = [ev for ev in candidates if (ev.get("entity"), ev.get("type")) not in lookups]
+    resolved = iter(
+        get_label_resolver().resolve_many((ev.get("entity"), ev.get("type")) for ev in pending)
+        if LABELS_DB_FILE else [None] * len(pending)
+    )
+    futures = []
+    for ev in candidates:
+        key = (ev.get("entity"), ev.get("type"))
+        if key in lookups:
+            futures.append(lookups[key])
+            continue
+        qid = next(resolved)
+        if qid:
+            future = Future()
+            future.set_result((qid, False))
+        else:
+            future = pool.submit(_with_failure_flag, search_entity_id, ev.get("entity"))
+        futures.append(future)
+
+    try:
+        for i, ev in enumerate(candidates):
+            qid, failed = futures[i].result()
+
+            ready = [
+                (f.result()[0], other.get("type")) for f, other in zip(futures[i:], candidates[i:])
+                if f.done() and not f.cancelled() and f.exception() is None
+            ]
+            fetch_dates_for_qids([
+                ready_qid for ready_qid, ready_type in ready
+                if not day_index or day_index.verdict(ready_qid, ready_type) is None
+            ])
+
+            print(f"🔍 Wikidata: validando '{ev.get('entity')}' ({ev.get('type')})")
+            valid = day_index.verdict(qid, ev.get("type")) if day_index else None
+            if valid is None:
+                failures = wikidata_failure_count()
+                valid = _check_candidate_dates(ev, qid, today_ddmm)
+                failed = failed or wikidata_failure_count() != failures
+            else:
+                trace_count("day_index_verdicts")
+                print(f"   -> Índice por día: {'fecha coincide. Válido' if valid else 'no es de hoy. Descartado'}.")
+            if registry:
+                # Sin QID o sin fechas por un error de red no es un descarte: puede volver y validarse
+                registry.record(ev, qid, None if failed and not valid else valid)
+            if valid:
+                ev["qid"] = qid
+                if LABELS_DB_FILE:
+                    # El texto del candidato queda como alias confirmado del QID
+                    get_label_resolver().add(qid, [ev.get("entity")])
+                yield ev
+            else:
+                print(f"⚠️ Evento descartado por Wikidata: {ev['text']}")
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def rank_candidates(events, old_texts=()):
+    """
+    Puntúa los candidatos no repetidos y los ordena en orden editorial:
+    primero por tipo (event → birth → death) y, dentro de cada tipo, por score descendente.
+    """
+    type_order = ("event", "birth", "death")
+    if not isinstance(old_texts, RepetitionIndex):
+        old_texts = RepetitionIndex(old_texts)
 
+    candidates = []
+    for ev in events:
+        if ev.get("type") not in type_order:
+            continue
+        if event_is_repeated(ev["text"], old_texts):
+            continue
+        compute_score(ev)
+        candidates.append(ev)
+
+    candidates.sort(key=lambda e: (type_order.index(e["type"]), -e["score"]))
+    return candidates
+
+
+# ----------------- Almacén offline de candidatos validados (366 días) ----------------- #
+
+def _store_path(ddmm):
+    return os.path.join(CANDIDATE_STORE_DIR, ddmm.replace("/", "-") + ".json")
+
+
+def load_stored_candidates(ddmm):
+    """Devuelve los candidatos validados y ordenados guardados para ese dd/mm, o None."""
+    path = _store_path(ddmm)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        candidates = data.get("candidates")
+        if data.get("ddmm") != ddmm or not isinstance(candidates, list):
+            return None
+        return [c for c in candidates if isinstance(c, dict) and c.get("text")]
+    except Exception as e:
+        print(f"⚠️ Error leyendo {path}:", e)
+        return None
+
+
+def choose_stored_event(today_ddmm, old_texts):
+    """Primer candidato del almacén offline para hoy que no esté repetido, o None."""
+    stored = load_stored_candidates(today_ddmm)
+    if not stored:
+        return None
+
+    for ev in stored:
+        if not event_is_repeated(ev["text"], old_texts):
+            print(f"📚 Usando candidato del almacén offline ({len(stored)} validados para {today_ddmm}).")
+            return ev
+
+    print(f"📚 Todos los candidatos del almacén para {today_ddmm} están repetidos. Se generan nuevos.")
     return None
 
 
+def build_store_for_day(month, day, rounds):
+    """
+    Genera candidatos con OpenAI para un dd/mm (varias rondas, sin duplicados),
+    los valida todos con Wikidata y guarda los válidos en orden editorial.
+    Si no termina ninguna ronda (p. ej. OpenAI caído) no escribe nada y lanza
+    RuntimeError, para que el día siga pendiente en la próxima construcción.
+    """
+    year, month, day, month_name = date_info(next_occurrence(month, day))
+    ddmm = f"{day:02d}/{month:02d}"
+
+    events = []
+    seen = set()
+    completed = 0
+    for attempt in range(1, rounds + 1):
+        try:
+            batch = fetch_openai_events_for_today(year, month, day, month_name, attempt)
+        except Exception as e:
+            print(f"❌ {ddmm}: error generando efemérides desde OpenAI (ronda {attempt}):", e)
+            continue
+        completed += 1
+        for ev in batch:
+            key = (ev["type"], ev["entity"].lower(), ev["year"])
+            if key not in seen:
+                seen.add(key)
+                events.append(ev)
+
+    if not completed:
+        raise RuntimeError(f"ninguna de las {rounds} rondas de generación terminó; el día queda pendiente")
+
+    valid = list(_iter_valid_candidates(rank_candidates(events), ddmm))
+    data = {
+        "ddmm": ddmm,
+        "built_at": datetime.datetime.utcnow().isoformat() + "Z",
+        "generated": len(events),
+        "candidates": [{k: v for k, v in ev.items() if k != "raw"} for ev in valid],
+    }
+    write_json_atomic(_store_path(ddmm), data)
+    return ddmm, len(events), len(valid)
+
+
+def build_candidate_store(from_ddmm=None, to_ddmm=None, force=False, workers=None):
+    """
+    Construye el almacén offline para un rango de días (por defecto, los 366).
+    Es reanudable: los días que ya tienen fichero se saltan salvo con force.
+    """
+    workers = max(1, workers or STORE_BUILD_WORKERS)
+    rounds = max(1, _env_int("OPENAI_GENERATION_ATTEMPTS", 2))
+    os.makedirs(CANDIDATE_STORE_DIR, exist_ok=True)
+
+    days = ddmm_range(from_ddmm, to_ddmm)
+    if not force:
+        days = [(m, d) for m, d in days if not os.path.exists(_store_path(f"{d:02d}/{m:02d}"))]
+
+    print(f"🏗️ Almacén de candidatos: {len(days)} días por construir ({workers} en paralelo).")
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(build_store_for_day, m, d, rounds): (m, d) for m, d in days}
+        for future in as_completed(futures):
+            month, day = futures[future]
+            try:
+                ddmm, n_generated, n_valid = future.result()
+                print(f"✅ {ddmm}: {n_valid} candidatos válidos de {n_generated} generados.")
+            except Exception as e:
+                print(f"❌ {day:02d}/{month:02d}: error construyendo el día:", e)
+            # Si el proceso se corta, las consultas a Wikidata ya hechas no se pierden
+            wikidata_cache.save()
+
+
 # ----------------- Generación de TEXTO con OpenAI ----------------- #
 
 def generate_headline_tweet(today_year, today_month_name, today_day, event):
@@ -884,7 +3188,8 @@ Reglas importantes:
 - No uses saltos de línea, todo debe ir en una sola frase.
 """
 
-    completion = client.chat.completions.create(
+    text = openai_chat(
+        "headline",
         model="gpt-4.1-mini",
         messages=[
             {
@@ -898,9 +3203,7 @@ Reglas importantes:
         ],
         temperature=0.4,
         max_tokens=200,
-    )
-
-    text = completion.choices[0].message.content.strip()
+    ).strip()
 
     if len(text) > 275:
         text = text[:272].rstrip() + "..."
@@ -950,11 +3253,12 @@ Tu tarea:
 
 FORMATO DE RESPUESTA:
 - Devuélveme EXCLUSIVAMENTE un JSON con esta forma:
-  {"tweets": ["texto del tuit 2", "texto del tuit 3", "..."]}
+  {{"tweets": ["texto del tuit 2", "texto del tuit 3", "..."]}}
 - No añadas nada fuera del JSON.
 """
 
-    completion = client.chat.completions.create(
+    raw = openai_chat(
+        "followups",
         model="gpt-4.1-mini",
         messages=[
             {
@@ -969,9 +3273,7 @@ FORMATO DE RESPUESTA:
         temperature=0.6,
         max_tokens=400,
         response_format={"type": "json_object"},
-    )
-
-    raw = completion.choices[0].message.content.strip()
+    ).strip()
 
     tweets = []
     try:
@@ -1027,6 +3329,119 @@ FORMATO DE RESPUESTA:
     return tweets
 
 
+# Esquema JSON de la respuesta en modo de generación "structured"
+THREAD_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "headline": {"type": "string"},
+        "followups": {
+            "type": "array",
+            "items": {"type": "string"},
+        },
+    },
+    "required": ["headline", "followups"],
+    "additionalProperties": False,
+}
+
+TWEET_MAX_CHARS = 260
+
+
+def validate_thread_locally(headline, followups, prefix):
+    """Devuelve la lista de problemas del hilo (vacía si cumple formato y longitudes)."""
+    problems = []
+    if not isinstance(headline, str) or not headline.strip():
+        return ["titular vacío"]
+    if not headline.startswith(prefix):
+        problems.append("el titular no empieza por el prefijo obligatorio")
+    if len(headline) > TWEET_MAX_CHARS:
+        problems.append(f"titular de {len(headline)} caracteres")
+    if "\n" in headline:
+        problems.append("el titular tiene saltos de línea")
+
+    if not isinstance(followups, list) or not 1 <= len(followups) <= 5:
+        problems.append("el hilo debe tener entre 1 y 5 tuits")
+        return problems
+    for i, t in enumerate(followups, start=2):
+        if not isinstance(t, str) or not t.strip():
+            problems.append(f"tuit {i} vacío")
+        elif len(t) > TWEET_MAX_CHARS:
+            problems.append(f"tuit {i} de {len(t)} caracteres")
+        elif t.startswith("🇪🇸") or t.lower().startswith("en tal día como hoy") or "#" in t:
+            problems.append(f"tuit {i} repite la fecha o lleva hashtags")
+    return problems
+
+
+def generate_thread_structured(today_year, today_month_name, today_day, event):
+    """
+    Genera titular + hilo en UNA sola llamada con salida restringida por esquema JSON.
+    Devuelve (headline, followups) o None si no pasa la validación local.
+    """
+    today_str = f"{today_day} de {today_month_name} de {today_year}"
+    event_year = event["year"]
+    event_text = event["text"]
+    hashtags = " ".join(DEFAULT_HASHTAGS)
+    prefix = f"🇪🇸 {today_str}: En tal día como hoy del año {event_year},"
+
+    prompt_user = f"""
+Fecha de hoy: {today_str}.
+Efeméride seleccionada (año {event_year}):
+
+\"\"\"{event_text}\"\"\"
+
+Escribe un hilo de X en español sobre esta efeméride:
+
+1) "headline": el tuit titular, en una sola frase, que empiece EXACTAMENTE por:
+   "{prefix}"
+   seguido de un resumen breve del hecho y terminado con estos hashtags, sin cambiarlos: {hashtags}
+   Sin más emojis, sin URLs y sin mencionar la fuente.
+
+2) "followups": entre 1 y 5 tuits que continúan el titular y explican qué supuso el hecho
+   para España o para el Imperio español, su contexto y sus consecuencias.
+   NO empiezan por la fecha ni por "En tal día como hoy...", sin hashtags y sin emojis.
+
+Reglas comunes:
+- Cada tuit (titular incluido) tiene como máximo {TWEET_MAX_CHARS} caracteres.
+- Fechas, cifras, nombres y lugares deben ser coherentes entre todos los tuits y con la efeméride.
+"""
+
+    raw = openai_chat(
+        "thread",
+        model="gpt-4.1-mini",
+        messages=[
+            {
+                "role": "system",
+                "content": (
+                    "Eres un divulgador de historia de España y del Imperio español. "
+                    "Escribes hilos de X breves, claros, coherentes y con ligero tono épico, "
+                    "respetando estrictamente el formato pedido."
+                ),
+            },
+            {"role": "user", "content": prompt_user},
+        ],
+        temperature=0.4,
+        max_tokens=900,
+        response_format={
+            "type": "json_schema",
+            "json_schema": {"name": "hilo_efemeride", "strict": True, "schema": THREAD_SCHEMA},
+        },
+    ).strip()
+
+    data = json.loads(clean_json_from_markdown(raw))
+    headline = data.get("headline")
+    followups = data.get("followups")
+    if isinstance(headline, str):
+        headline = headline.strip()
+    if isinstance(followups, list):
+        followups = [t.strip() if isinstance(t, str) else t for t in followups]
+
+    problems = validate_thread_locally(headline, followups, prefix)
+    if problems:
+        print("⚠️ El hilo en una sola llamada no pasa la validación local: " + "; ".join(problems))
+        return None
+
+    return headline, followups
+
+
 # ----------------- Publicación en X (API v2) ----------------- #
 
 def get_twitter_client():
@@ -1052,104 +3467,828 @@ def get_twitter_client():
     return client_tw
 
 
-def post_thread(headline, followups):
+def _publish_deadline(now=None):
+    """Instante (epoch) límite para seguir reintentando hoy: PUBLISH_DEADLINE y PUBLISH_MAX_WAIT_MINUTES."""
+    now = time.time() if now is None else now
+    limit = now + PUBLISH_MAX_WAIT_MINUTES * 60
+    try:
+        hour, minute = (int(x) for x in PUBLISH_DEADLINE.split(":"))
+        tz = pytz.timezone(TZ)
+        local_now = datetime.datetime.fromtimestamp(now, tz)
+        deadline = tz.localize(
+            datetime.datetime(local_now.year, local_now.month, local_now.day, hour, minute)
+        ).timestamp()
+        limit = min(limit, deadline)
+    except ValueError:
+        print(f"⚠️ PUBLISH_DEADLINE inválido ({PUBLISH_DEADLINE!r}); se usa solo PUBLISH_MAX_WAIT_MINUTES.")
+    return limit
+
+
+class PublishScheduler:
     """
-    Publica el tuit titular y, si hay followups, va respondiendo en hilo.
+    Controla el ritmo de publicación en X dentro de una ejecución:
+    - token bucket para espaciar los tuits del hilo;
+    - lee x-rate-limit-remaining/x-rate-limit-reset de cada respuesta y, si se ha
+      agotado la cuota, espera al reset antes del siguiente tuit;
+    - ante un 429 reintenta con backoff con jitter mientras quepa antes de la fecha
+      límite; si no cabe, relanza el 429. Un 5xx no se reintenta: X puede haber
+      publicado el tuit igualmente (ver publish_journal_thread).
     """
-    client_tw = get_twitter_client()
-
-    resp = client_tw.create_tweet(text=headline)
-    print("DEBUG create_tweet (headline) response:", resp)
-    tweet_id = resp.data.get("id")
-    if not tweet_id:
-        print("⚠️ No se obtuvo ID del tuit titular, no se puede continuar el hilo.")
-        return
 
-    parent_id = tweet_id
-    for t in followups:
+    def __init__(self, deadline=None, rate_per_minute=None, burst=None, max_attempts=None,
+                 clock=time.time, sleep=time.sleep):
+        self.clock = clock
+        self.sleep = sleep
+        self.deadline = _publish_deadline(clock()) if deadline is None else deadline
+        self.rate = (PUBLISH_TWEETS_PER_MINUTE if rate_per_minute is None else rate_per_minute) / 60
+        self.capacity = PUBLISH_BURST if burst is None else burst
+        self.max_attempts = PUBLISH_MAX_ATTEMPTS if max_attempts is None else max_attempts
+        self.tokens = float(self.capacity)
+        self.refilled_at = clock()
+        self.remaining = None
+        self.reset_at = None
+        self.waited = 0.0
+
+    def observe(self, response, *args, **kwargs):
+        """Hook de respuesta de requests: guarda la cuota que anuncia X."""
+        headers = getattr(response, "headers", None) or {}
         try:
-            resp = client_tw.create_tweet(text=t, in_reply_to_tweet_id=parent_id)
-            print("DEBUG create_tweet (reply) response:", resp)
-            new_id = resp.data.get("id")
-            if new_id:
-                parent_id = new_id
-        except Exception as e:
-            print("❌ Error publicando un tuit de hilo:", e)
-            break
+            if "x-rate-limit-remaining" in headers:
+                self.remaining = int(headers["x-rate-limit-remaining"])
+            if "x-rate-limit-reset" in headers:
+                self.reset_at = float(headers["x-rate-limit-reset"])
+        except (TypeError, ValueError):
+            pass
+        return response
+
+    def _wait(self, seconds, reason):
+        if seconds <= 0:
+            return
+        if self.clock() + seconds > self.deadline:
+            raise TimeoutError(f"esperar {seconds:.0f} s ({reason}) supera la hora límite de publicación")
+        print(f"⏳ X: esperando {seconds:.1f} s ({reason}).")
+        with span("publish_wait", reason=reason, seconds=round(seconds, 3)):
+            self.sleep(seconds)
+        self.waited += seconds
+
+    def acquire(self):
+        """Espera lo necesario antes de enviar el siguiente tuit."""
+        now = self.clock()
+        if self.remaining == 0 and self.reset_at and self.reset_at > now:
+            self._wait(self.reset_at - now + random.uniform(0.5, 2.0), "cuota agotada")
+            self.remaining = None
+
+        now = self.clock()
+        if self.rate > 0:
+            self.tokens = min(self.capacity, self.tokens + (now - self.refilled_at) * self.rate)
+            self.refilled_at = now
+            if self.tokens < 1:
+                self._wait((1 - self.tokens) / self.rate, "ritmo del hilo")
+                self.tokens = 1.0
+                self.refilled_at = self.clock()
+            self.tokens -= 1
+
+    def retry_delay(self, attempt, exc):
+        """Segundos hasta el siguiente intento: al reset anunciado o backoff exponencial, con jitter."""
+        response = getattr(exc, "response", None)
+        if response is not None:
+            self.observe(response)
+            retry_after = (getattr(response, "headers", None) or {}).get("retry-after")
+            if retry_after and str(retry_after).isdigit():
+                # Retry-After manda sobre la cuota anunciada
+                self.remaining = None
+                return int(retry_after) + random.uniform(0, 1)
+        now = self.clock()
+        if isinstance(exc, tweepy.errors.TooManyRequests) and self.reset_at and self.reset_at > now:
+            return self.reset_at - now + random.uniform(0.5, 2.0 + 0.1 * (self.reset_at - now))
+        return random.uniform(1, min(300, 5 * 2 ** attempt))
+
+    def call(self, func, *args, **kwargs):
+        """
+        Llama a func (p. ej. create_tweet) respetando ritmo, cuota y hora límite.
+        Solo reintenta los 429, que X rechaza sin publicar nada. Si la espera no cabe
+        antes de la hora límite se relanza el último 429 (o TimeoutError si la cuota
+        agotada la anunciaron las cabeceras sin llegar a un 429).
+        """
+        last_exc = None
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                self.acquire()
+            except TimeoutError as timeout:
+                print(f"❌ {timeout}. Se abandona.")
+                if last_exc is not None:
+                    raise last_exc
+                raise
+            try:
+                return func(*args, **kwargs)
+            except tweepy.errors.TooManyRequests as exc:
+                if attempt == self.max_attempts:
+                    raise
+                last_exc = exc
+                trace_count("retries")
+                delay = self.retry_delay(attempt, exc)
+                print(f"⚠️ X respondió {exc.__class__.__name__} (intento {attempt}/{self.max_attempts}).")
+                try:
+                    self._wait(delay, "rate limit")
+                except TimeoutError as timeout:
+                    print(f"❌ {timeout}. Se abandona.")
+                    raise exc
+
 
+def _timeline_text(text):
+    """Texto de un tuit comparable con el del diario: sin entidades HTML, @menciones iniciales ni espacios extra."""
+    text = re.sub(r"^(@\w+\s+)+", "", html.unescape(text or "").strip())
+    return " ".join(text.split())
 
-def try_publish_pending_thread(pending):
-    """Intenta publicar un hilo pendiente. Devuelve True si se publicó o False si se mantiene."""
-    print("📨 Hay un hilo pendiente en pending_tweet.json. Intentando publicarlo primero...")
+
+def find_posted_tweet(text, since):
+    """
+    Busca en el timeline de la cuenta un tuit con ese texto publicado desde since
+    (ISO, UTC). Devuelve (comprobado, tweet_id): comprobado=False si no se pudo leer
+    el timeline, y tweet_id=None si se leyó y el tuit no está.
+    """
+    if not TW_BEARER_TOKEN or not TWITTER_USER_ID:
+        return False, None
+    cli = tweepy.Client(bearer_token=TW_BEARER_TOKEN)
     try:
-        post_thread(pending["headline"], pending.get("followups", []))
-        print("✅ Hilo pendiente publicado correctamente.")
-        clear_pending_tweet()
-        return True
-    except tweepy.errors.TooManyRequests:
-        print("❌ Rate limit 429 al publicar el hilo pendiente. Se mantiene en cola y se aborta hoy.")
-        return False
+        resp = cli.get_users_tweets(
+            id=TWITTER_USER_ID,
+            max_results=100,
+            start_time=since[:19] + "Z" if since else None,
+            tweet_fields=["created_at", "text"],
+        )
     except Exception as e:
-        print("❌ Error publicando el hilo pendiente:", e)
-        print("Se mantiene en cola y se aborta hoy para no perderlo.")
+        print("⚠️ No se pudo consultar el timeline para comprobar el tuit:", e)
+        return False, None
+    wanted = _timeline_text(text)
+    for t in resp.data or []:
+        if _timeline_text(t.text) == wanted:
+            return True, str(t.id)
+    return True, None
+
+
+def settle_uncertain_tweet(journal, entry, index):
+    """
+    Resuelve un tuit del diario marcado como incierto (X respondió 5xx al publicarlo):
+    si aparece en el timeline se adopta su ID; si no, se desmarca para publicarlo.
+    Devuelve False si no se pudo comprobar, y entonces no debe publicarse.
+    """
+    tweet = entry["tweets"][index]
+    checked, tweet_id = find_posted_tweet(tweet["text"], entry.get("queued_at"))
+    if not checked:
         return False
+    if tweet_id:
+        print(f"🔎 El tuit {index + 1} del hilo ya estaba publicado ({tweet_id}); se recupera su ID.")
+        tweet["tweet_id"] = tweet_id
+        entry["status"] = "partial"
+        if index == 0:
+            record_published_tweet(tweet_id, tweet["text"])
+    else:
+        print(f"🔎 El tuit {index + 1} del hilo no aparece en el timeline; se volverá a publicar.")
+    tweet.pop("uncertain", None)
+    save_publish_journal(journal)
+    return True
 
 
-# ----------------- Main ----------------- #
+def publish_journal_thread(journal, entry, scheduler=None):
+    """
+    Publica lo que falte de un hilo del diario: continúa respondiendo desde el último
+    tuit publicado y guarda cada ID en cuanto X lo devuelve, así un reintento nunca
+    duplica el titular ni regenera nada. Si X responde 5xx el tuit queda marcado como
+    incierto y, antes de volver a publicarlo, se busca en el timeline. Los errores se
+    propagan con el hilo a medias en el diario. Devuelve True si el hilo queda completo.
+    """
+    client_tw = get_twitter_client()
+    scheduler = scheduler or PublishScheduler()
+    client_tw.session.hooks["response"].append(scheduler.observe)
+
+    parent_id = None
+    for i, tweet in enumerate(entry["tweets"]):
+        if tweet.get("uncertain") and not settle_uncertain_tweet(journal, entry, i):
+            raise RuntimeError(
+                f"no se pudo comprobar si el tuit {i + 1} del hilo llegó a publicarse; no se reintenta"
+            )
+        if tweet.get("tweet_id"):
+            parent_id = tweet["tweet_id"]
+            continue
 
-def main():
-    today_year, today_month, today_day, today_month_name = today_info()
-    today_ddmm = f"{today_day:02d}/{today_month:02d}"
+        kwargs = {"text": tweet["text"]}
+        if parent_id:
+            kwargs["in_reply_to_tweet_id"] = parent_id
+        with span("create_tweet", reply=parent_id is not None):
+            try:
+                resp = scheduler.call(client_tw.create_tweet, **kwargs)
+            except tweepy.errors.TwitterServerError:
+                # X puede haberlo publicado aunque responda 5xx: no se reintenta a ciegas
+                tweet["uncertain"] = True
+                save_publish_journal(journal)
+                raise
+        print(f"DEBUG create_tweet ({'reply' if parent_id else 'headline'}) response:", resp)
+
+        tweet_id = (resp.data or {}).get("id")
+        if not tweet_id:
+            # Sin ID no se puede encadenar el resto ni saber si reintentar duplicaría
+            print("⚠️ X no devolvió el ID del tuit, no se puede continuar el hilo.")
+            entry["status"] = "abandoned"
+            save_publish_journal(journal)
+            return False
+
+        tweet["tweet_id"] = str(tweet_id)
+        entry["status"] = "partial"
+        save_publish_journal(journal)
+        if i == 0:
+            record_published_tweet(tweet_id, tweet["text"])
+        parent_id = tweet["tweet_id"]
+
+    entry["status"] = "done"
+    entry["published_at"] = datetime.datetime.utcnow().isoformat() + "Z"
+    save_publish_journal(journal)
+    return True
+
+
+def post_thread(headline, followups, target_ddmm=None, scheduler=None):
+    """
+    Publica el tuit titular y, si hay followups, va respondiendo en hilo.
+    El hilo pasa antes por el diario de publicación, así que si algo falla a medias
+    la siguiente ejecución lo retoma. Los 429 se esperan dentro de la misma ejecución
+    (ver PublishScheduler).
+    """
+    journal = load_publish_journal()
+    entry = enqueue_thread(journal, headline, followups, target_ddmm, today_date())
+    return publish_journal_thread(journal, entry, scheduler)
 
-    print(f"Hoy es {today_day}/{today_month}/{today_year} ({today_month_name}).")
 
-    # 0) Si hay un hilo pendiente de días anteriores, intentamos publicarlo primero
-    pending = load_pending_tweet()
-    if pending:
-        pending_ddmm = pending.get("target_ddmm")
-        if pending_ddmm != today_ddmm:
+def resume_journal_threads(today_ddmm, scheduler=None):
+    """
+    Retoma los hilos del diario sin terminar. Los que ya tienen el titular publicado
+    se completan siempre; los que no empezaron, solo si su dd/mm es hoy.
+    Devuelve False si hoy no debe publicarse nada más (429, o fallo del hilo de hoy).
+    """
+    journal = load_publish_journal()
+    for entry in journal["threads"]:
+        if entry.get("status") not in JOURNAL_OPEN_STATUSES:
+            continue
+        target = entry.get("target_ddmm")
+        if entry["status"] == "queued" and target != today_ddmm and entry["tweets"][0].get("uncertain"):
+            # El titular pudo salir pese al 5xx: hay que saberlo antes de descartar el hilo
+            if not settle_uncertain_tweet(journal, entry, 0):
+                print(f"⚠️ No se pudo comprobar si el hilo de {target} llegó a publicarse. Se deja en el diario.")
+                continue
+        if entry["status"] == "queued" and target != today_ddmm:
             print(
-                "⚠️ Hay un hilo pendiente, pero su fecha objetivo no coincide con hoy. "
-                "No se publicará para evitar errores de dd/mm."
+                f"⚠️ Hay un hilo en cola para {target}, pero no es hoy. "
+                "Se descarta para evitar errores de dd/mm."
             )
-        else:
-            if not try_publish_pending_thread(pending):
+            entry["status"] = "discarded"
+            save_publish_journal(journal)
+            continue
+
+        posted = sum(1 for t in entry["tweets"] if t.get("tweet_id"))
+        print(f"📨 Retomando hilo del diario ({target}): {posted}/{len(entry['tweets'])} tuits ya publicados.")
+        try:
+            if publish_journal_thread(journal, entry, scheduler):
+                print("✅ Hilo del diario completado.")
+        except (tweepy.errors.TooManyRequests, TimeoutError):
+            print("❌ Rate limit de X al retomar el hilo. Sigue en el diario y se aborta hoy.")
+            return False
+        except Exception as e:
+            entry["failures"] = entry.get("failures", 0) + 1
+            if entry["failures"] >= PUBLISH_JOURNAL_MAX_FAILURES:
+                entry["status"] = "abandoned"
+                print(f"🗑️ Hilo del diario abandonado tras {entry['failures']} ejecuciones con error.")
+            save_publish_journal(journal)
+            print("❌ Error retomando el hilo del diario:", e)
+            if target == today_ddmm:
+                print("Se mantiene en el diario y se aborta hoy para no duplicarlo.")
+                return False
+    return True
+
+
+# ----------------- Auditoría retrospectiva (exportaciones de X) ----------------- #
+
+# Titular completo: "🇪🇸 {d} de {mes} de {yyyy}: En tal día como hoy del año {año}, {descripción}"
+AUDIT_HEADLINE_RE = re.compile(
+    r"^\s*🇪🇸\s*(\d{1,2}) de ([a-záéíóú]+) de (\d{4}):\s*En tal día como hoy del año (-?\d+),?\s*(.*)$",
+    re.IGNORECASE | re.DOTALL,
+)
+
+# Error de auditoría que no dice nada del tuit: el veredicto se guarda para el
+# informe, pero ya caducado, y se revalida al relanzar
+AUDIT_WIKIDATA_UNAVAILABLE = "Wikidata no disponible"
+
+AUDIT_REPORT_FIELDS = [
+    "tweet_id", "url", "text", "published_at", "published_ddmm", "claimed_ddmm",
+    "event_year", "entity", "type", "qid", "real_date", "status", "error",
+    "recommendation", "correct_date",
+]
+
+
+def iter_json_array_items(chunks, buffer_limit=1 << 16):
+    """
+    Recorre en streaming los elementos del primer array JSON que aparezca en una
+    secuencia de trozos de texto (fichero, respuesta en streaming...), sin cargarlo
+    entero en memoria. Sirve tanto para tweets.js ("window.YTD... = [...]") como
+    para {"events": [...]}.
+    """
+    decoder = json.JSONDecoder()
+    chunks = iter(chunks)
+    buf = ""
+    pos = None
+
+    while pos is None:
+        chunk = next(chunks, None)
+        if chunk is None:
+            return
+        buf += chunk
+        bracket = buf.find("[")
+        if bracket != -1:
+            pos = bracket + 1
+
+    while True:
+        while pos < len(buf) and buf[pos] in " \t\r\n,":
+            pos += 1
+        if pos < len(buf) and buf[pos] == "]":
+            return
+        try:
+            if pos >= len(buf):
+                raise json.JSONDecodeError("sin datos", buf, pos)
+            item, pos = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            chunk = next(chunks, None)
+            if chunk is None:
                 return
+            buf = buf[pos:] + chunk
+            pos = 0
+            continue
+        yield item
+        if pos > buffer_limit:
+            buf = buf[pos:]
+            pos = 0
+
+
+def _read_chunks(f, size=1 << 16):
+    while True:
+        chunk = f.read(size)
+        if not chunk:
+            return
+        yield chunk
 
-    # 1) Anti-repetición basándose en tu timeline reciente
-    old_texts = fetch_previous_events_same_day(today_month, today_day)
 
-    # 2) Fuente principal: OpenAI genera efemérides del día (con múltiples rondas)
+def _parse_tweet_datetime(value):
+    """Fecha de un tuit en formato de exportación de X ("Wed Oct 10 20:19:24 +0000 2018") o ISO."""
+    if isinstance(value, datetime.datetime):
+        return value
+    if not value:
+        return None
+    for fmt in ("%a %b %d %H:%M:%S %z %Y",):
+        try:
+            return datetime.datetime.strptime(value, fmt)
+        except ValueError:
+            pass
     try:
-        attempts = int(os.getenv("OPENAI_GENERATION_ATTEMPTS", "2"))
+        parsed = datetime.datetime.fromisoformat(str(value).replace("Z", "+00:00"))
     except ValueError:
-        attempts = 2
-    attempts = max(1, attempts)
-    best = None
-    for attempt in range(1, attempts + 1):
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=datetime.timezone.utc)
+
+
+def _normalize_archive_item(item):
+    """Pasa un tuit de cualquier formato de exportación a {id, text, created_at}, o None."""
+    if not isinstance(item, dict):
+        return None
+    if isinstance(item.get("tweet"), dict):
+        item = item["tweet"]
+    tweet_id = item.get("id_str") or item.get("id") or item.get("tweet_id")
+    text = item.get("full_text") or item.get("text") or item.get("tweet_text")
+    if not tweet_id or not isinstance(text, str):
+        return None
+    created_at = _parse_tweet_datetime(item.get("created_at") or item.get("timestamp"))
+    return {"id": str(tweet_id), "text": text, "created_at": created_at}
+
+
+def iter_archive_tweets(path):
+    """
+    Lee en streaming una exportación de tuits: tweets.js / JSON (array), JSON Lines o CSV.
+    Devuelve los tuits normalizados uno a uno.
+    """
+    lower = path.lower()
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if lower.endswith(".csv"):
+            items = csv.DictReader(f)
+        elif lower.endswith(".jsonl"):
+            items = (json.loads(line) for line in f if line.strip())
+        else:
+            items = iter_json_array_items(_read_chunks(f))
+        for item in items:
+            tweet = _normalize_archive_item(item)
+            if tweet:
+                yield tweet
+
+
+def parse_audit_headline(text):
+    """Extrae (claimed_ddmm, año del evento, descripción) de un titular, o None si no lo es."""
+    match = AUDIT_HEADLINE_RE.match(text or "")
+    if not match:
+        return None
+    day, month_name, _, event_year, description = match.groups()
+    month_name = month_name.lower()
+    if month_name not in MONTH_NAMES[1:]:
+        return None
+    claimed_ddmm = f"{int(day):02d}/{MONTH_NAMES.index(month_name):02d}"
+    for tag in DEFAULT_HASHTAGS:
+        description = description.replace(tag, "")
+    return claimed_ddmm, int(event_year), description.strip()
+
+
+def identify_audit_event(description, event_year):
+    """
+    Pide a OpenAI la entidad de Wikidata y el tipo (event/birth/death) del hecho
+    descrito en un titular. Devuelve (entity, type) o (None, None).
+    """
+    prompt = f"""
+Este es el resumen de una efeméride publicada (año {event_year}):
+
+\"\"\"{description}\"\"\"
+
+Identifica el hecho histórico principal y devuelve EXCLUSIVAMENTE un JSON:
+{{"entity": "nombre del artículo/entidad en Wikidata en español", "type": "event" | "birth" | "death"}}
+
+- "birth"/"death" solo si el tuit trata del nacimiento o la muerte de una persona (entity = la persona).
+- Si no puedes identificar un hecho concreto, devuelve {{"entity": "", "type": "event"}}.
+"""
+    raw = openai_chat(
+        "audit_extract",
+        model="gpt-4.1-mini",
+        messages=[
+            {"role": "system", "content": "Identificas hechos históricos para validarlos en Wikidata."},
+            {"role": "user", "content": prompt},
+        ],
+        temperature=0,
+        max_tokens=100,
+        response_format={"type": "json_object"},
+    ).strip()
+
+    try:
+        data = json.loads(clean_json_from_markdown(raw))
+    except Exception as e:
+        print(f"⚠️ No se ha podido parsear la entidad auditada: {e}")
+        return None, None
+    entity = data.get("entity")
+    cand_type = data.get("type")
+    if not isinstance(entity, str) or not entity.strip() or cand_type not in {"event", "birth", "death"}:
+        return None, None
+    return entity.strip(), cand_type
+
+
+def _wikidata_full_date(time_values):
+    """dd/mm/aaaa del primer valor de Wikidata con día y mes, o None."""
+    for value in time_values:
+        match = re.match(r"^([+-]?\d{4,})-(\d{2})-(\d{2})", value or "")
+        if match and match.group(2) != "00" and match.group(3) != "00":
+            return f"{match.group(3)}/{match.group(2)}/{int(match.group(1))}"
+    return None
+
+
+def _audit_record(tweet, parsed):
+    """Registro del informe de un titular, aún sin veredicto (status "error")."""
+    claimed_ddmm, event_year, _ = parsed
+    created_at = tweet.get("created_at")
+    published_ddmm = _published_ddmm(created_at) if created_at else None
+    return {
+        "tweet_id": tweet["id"],
+        "url": f"https://x.com/Efemerides_Imp/status/{tweet['id']}",
+        "text": tweet["text"],
+        "published_at": created_at.isoformat() if created_at else "",
+        "published_ddmm": published_ddmm or "",
+        "claimed_ddmm": claimed_ddmm,
+        "event_year": event_year,
+        "entity": "",
+        "type": "",
+        "qid": "",
+        "real_date": "",
+        "status": "error",
+        "error": "",
+        "recommendation": "no corregible",
+        "correct_date": "",
+    }
+
+
+def audit_tweet(tweet):
+    """
+    Audita un tuit publicado como efeméride diaria: identifica el evento, obtiene
+    su fecha real en Wikidata y la compara con la fecha de publicación.
+    Devuelve un dict con las columnas de AUDIT_REPORT_FIELDS, o None si no es un titular.
+    """
+    parsed = parse_audit_headline(tweet["text"])
+    if not parsed:
+        return None
+    claimed_ddmm, event_year, description = parsed
+    record = _audit_record(tweet, parsed)
+    # Si la exportación no trae fecha, se toma la declarada en el titular
+    expected_ddmm = record["published_ddmm"] or claimed_ddmm
+
+    failures = wikidata_failure_count()
+    entity, cand_type = identify_audit_event(description, event_year)
+    if not entity:
+        record["error"] = "evento no identificado"
+        return record
+    record["entity"], record["type"] = entity, cand_type
+
+    qid = resolve_entity_id(entity, cand_type)
+    if not qid:
+        if wikidata_failure_count() != failures:
+            record["error"] = AUDIT_WIKIDATA_UNAVAILABLE
+        else:
+            record["error"] = "evento no encontrado en Wikidata"
+        return record
+    record["qid"] = qid
+
+    dates = fetch_dates_for_qid(qid)
+    real_ddmm, reason, prop = candidate_ddmm_from_dates(cand_type, dates)
+    if real_ddmm is None:
+        if wikidata_failure_count() != failures:
+            record["error"] = AUDIT_WIKIDATA_UNAVAILABLE
+        elif reason == "ambigüedad de fechas en Wikidata":
+            record["error"] = "ambigüedad histórica"
+        else:
+            record["error"] = "fecha incierta"
+        return record
+
+    real_date = _wikidata_full_date(dates.get(prop, [])) or real_ddmm
+    record["real_date"] = real_date
+
+    if real_ddmm == expected_ddmm and claimed_ddmm == expected_ddmm:
+        record["status"] = "ok"
+        record["recommendation"] = ""
+        return record
+
+    if real_ddmm[3:] != expected_ddmm[3:]:
+        record["error"] = "mes incorrecto"
+    elif real_ddmm != expected_ddmm:
+        record["error"] = "día incorrecto"
+    else:
+        record["error"] = "el titular declara otra fecha distinta a la de publicación"
+    record["recommendation"] = "corregible"
+    record["correct_date"] = real_date
+    return record
+
+
+class _AuditReportWriter:
+    """Escribe el informe de auditoría en JSON o CSV a medida que llegan los registros."""
+
+    def __init__(self, path, fmt):
+        self.fmt = fmt
+        self.f = open(path, "w", encoding="utf-8", newline="")
+        self.count = 0
+        if fmt == "csv":
+            self.writer = csv.DictWriter(self.f, fieldnames=AUDIT_REPORT_FIELDS)
+            self.writer.writeheader()
+        else:
+            self.f.write('{"results": [\n')
+
+    def write(self, record):
+        if self.fmt == "csv":
+            self.writer.writerow(record)
+        else:
+            if self.count:
+                self.f.write(",\n")
+            self.f.write(json.dumps(record, ensure_ascii=False))
+        self.count += 1
+
+    def close(self, summary):
+        if self.fmt != "csv":
+            self.f.write('\n],\n"summary": ')
+            self.f.write(json.dumps(summary, ensure_ascii=False, indent=2))
+            self.f.write("}\n")
+        self.f.close()
+
+
+def open_audit_db(path=None):
+    """Abre (y crea si hace falta) la base de datos de veredictos de auditoría."""
+    conn = sqlite3.connect(path or AUDIT_DB_FILE)
+    conn.executescript(
+        """
+        CREATE TABLE IF NOT EXISTS verdicts (
+            tweet_id TEXT PRIMARY KEY,
+            text_hash TEXT NOT NULL,
+            status TEXT NOT NULL,
+            record TEXT NOT NULL,
+            audited_at REAL NOT NULL,
+            expires_at REAL NOT NULL
+        );
+        """
+    )
+    return conn
+
+
+def _text_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _needs_audit(conn, tweet, now):
+    """True si el tuit es nuevo, ha cambiado o su evidencia de Wikidata ha caducado."""
+    row = conn.execute(
+        "SELECT text_hash, expires_at FROM verdicts WHERE tweet_id = ?", (tweet["id"],)
+    ).fetchone()
+    return row is None or row[0] != _text_hash(tweet["text"]) or row[1] <= now
+
+
+def _store_verdict(conn, tweet, record, retry=False):
+    """
+    Guarda el veredicto de un tuit. Con retry (o si Wikidata no respondió) se guarda
+    ya caducado: sale en el informe, pero la próxima auditoría lo vuelve a validar.
+    """
+    now = time.time()
+    retry = retry or record.get("error") == AUDIT_WIKIDATA_UNAVAILABLE
+    conn.execute(
+        "INSERT OR REPLACE INTO verdicts (tweet_id, text_hash, status, record, audited_at, expires_at) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        (
+            tweet["id"],
+            _text_hash(tweet["text"]),
+            record["status"],
+            json.dumps(record, ensure_ascii=False),
+            now,
+            now if retry else now + WIKIDATA_CACHE_TTL_DAYS * 86400,
+        ),
+    )
+
+
+def write_audit_report(conn, output_path, fmt="json", include_ok=False):
+    """Reconstruye el informe a partir de los veredictos guardados, sin revalidar nada."""
+    writer = _AuditReportWriter(output_path, fmt)
+    summary = {"headlines": 0, "ok": 0, "errors": 0, "by_error": {}}
+
+    rows = conn.execute("SELECT record FROM verdicts ORDER BY CAST(tweet_id AS INTEGER)")
+    for (raw,) in rows:
+        record = json.loads(raw)
+        summary["headlines"] += 1
+        if record["status"] == "ok":
+            summary["ok"] += 1
+        else:
+            summary["errors"] += 1
+            summary["by_error"][record["error"]] = summary["by_error"].get(record["error"], 0) + 1
+        if include_ok or record["status"] != "ok":
+            writer.write(record)
+
+    writer.close(summary)
+    return summary
+
+
+def run_audit(archive_path, output_path=None, fmt="json", workers=None, include_ok=False, force=False):
+    """
+    Audita una exportación de tuits en streaming con concurrencia acotada.
+    Los veredictos se guardan en AUDIT_DB_FILE con checkpoints periódicos: al
+    relanzar solo se revalidan los tuits nuevos, cambiados o con evidencia caducada
+    (o todos con force). El informe se reconstruye desde los veredictos guardados.
+    """
+    workers = max(1, workers or AUDIT_WORKERS)
+    output_path = output_path or f"audit_report.{fmt}"
+    conn = open_audit_db()
+    stats = {"tweets": 0, "headlines": 0, "reused": 0, "audited": 0, "failed": 0}
+    start = time.perf_counter()
+    now = time.time()
+
+    def handle(tweet, future):
         try:
-            events = fetch_openai_events_for_today(today_year, today_month, today_day, today_month_name)
+            record = future.result()
+        except Exception as e:
+            # Un fallo en un tuit (OpenAI, red...) no para la auditoría: queda para la próxima
+            print(f"❌ Error auditando el tuit {tweet['id']}: {e}")
+            record = _audit_record(tweet, parse_audit_headline(tweet["text"]))
+            record["error"] = f"error en la auditoría: {type(e).__name__}: {e}"
+            _store_verdict(conn, tweet, record, retry=True)
+            stats["failed"] += 1
+            return
+        if record is None:
+            return
+        _store_verdict(conn, tweet, record)
+        stats["audited"] += 1
+        if stats["audited"] % AUDIT_CHECKPOINT_EVERY == 0:
+            conn.commit()
+            wikidata_cache.save()
             print(
-                f"Ronda {attempt}/{attempts}: "
-                f"se han generado {len(events)} efemérides desde OpenAI para "
-                f"{today_day}/{today_month}/{today_year}."
+                f"💾 Auditoría: checkpoint con {stats['audited']} tuits revalidados "
+                f"({stats['tweets']} leídos)."
             )
-        except Exception as e:
-            print(f"❌ Error generando efemérides desde OpenAI (ronda {attempt}):", e)
-            events = []
 
-        if not events:
-            continue
+    try:
+        # Como mucho workers*4 tuits en vuelo: memoria constante
+        in_flight = deque()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for tweet in iter_archive_tweets(archive_path):
+                stats["tweets"] += 1
+                if not parse_audit_headline(tweet["text"]):
+                    continue
+                stats["headlines"] += 1
+                if not force and not _needs_audit(conn, tweet, now):
+                    stats["reused"] += 1
+                    continue
+                in_flight.append((tweet, pool.submit(audit_tweet, tweet)))
+                if len(in_flight) >= workers * 4:
+                    handle(*in_flight.popleft())
+            while in_flight:
+                handle(*in_flight.popleft())
+        conn.commit()
+
+        summary = write_audit_report(conn, output_path, fmt, include_ok)
+    finally:
+        # Lo ya validado se conserva aunque la ejecución se corte a mitad
+        conn.commit()
+        conn.close()
+
+    print(
+        f"✅ Auditoría terminada en {time.perf_counter() - start:.2f} s: "
+        f"{stats['headlines']} titulares de {stats['tweets']} tuits, "
+        f"{stats['audited']} revalidados, {stats['reused']} reutilizados y {stats['failed']} con error. "
+        f"{summary['errors']} erróneos en total. Informe en {output_path}."
+    )
+    return summary
+
+
+def rebuild_audit_report(output_path=None, fmt="json", include_ok=False):
+    """Solo regenera el informe desde AUDIT_DB_FILE."""
+    output_path = output_path or f"audit_report.{fmt}"
+    conn = open_audit_db()
+    try:
+        summary = write_audit_report(conn, output_path, fmt, include_ok)
+    finally:
+        conn.close()
+    print(f"✅ Informe regenerado desde {AUDIT_DB_FILE}: {summary['errors']} erróneos. Informe en {output_path}.")
+    return summary
+
+
+# ----------------- Main ----------------- #
+
+def select_event_for_date(today_year, today_month, today_day, today_month_name, old_texts):
+    """
+    Elige la efeméride de un día: primero el almacén offline y, si no hay nada
+    utilizable, varias rondas de generación con OpenAI + validación en Wikidata.
+    """
+    today_ddmm = f"{today_day:02d}/{today_month:02d}"
+
+    # Si hay almacén offline para ese día, sus candidatos ya vienen validados y ordenados
+    best = choose_stored_event(today_ddmm, old_texts) if USE_CANDIDATE_STORE else None
 
-        best = choose_best_verified_event(events, old_texts, today_ddmm)
+    # Fuente principal: OpenAI genera efemérides del día (con múltiples rondas)
+    try:
+        attempts = int(os.getenv("OPENAI_GENERATION_ATTEMPTS", "2"))
+    except ValueError:
+        attempts = 2
+    attempts = max(1, attempts)
+    registry = CandidateRegistry()
+    for attempt in range(1, attempts + 1):
         if best:
             break
+        if attempt > 1:
+            trace_count("retries")
+        with span("generation_round", attempt=attempt, ddmm=today_ddmm) as sp:
+            streamed_best = None
+            registry.begin_round()
+            duplicates = registry.duplicates
+            try:
+                if OPENAI_STREAM_CANDIDATES:
+                    events, streamed_best = choose_best_streamed_event(
+                        today_year, today_month, today_day, today_month_name, old_texts, attempt, registry
+                    )
+                else:
+                    events = registry.admit_many(fetch_openai_events_for_today(
+                        today_year, today_month, today_day, today_month_name, attempt,
+                        registry.exclusions(),
+                    ))
+                duplicates = registry.duplicates - duplicates
+                print(
+                    f"Ronda {attempt}/{attempts}: "
+                    f"se han generado {len(events)} efemérides nuevas desde OpenAI para "
+                    f"{today_day}/{today_month}/{today_year}"
+                    + (f" ({duplicates} repetidas de rondas anteriores)." if duplicates else ".")
+                )
+            except Exception as e:
+                print(f"❌ Error generando efemérides desde OpenAI (ronda {attempt}):", e)
+                events = []
+                duplicates = 0
+
+            sp.set(candidates=len(events), duplicates=duplicates, stream=OPENAI_STREAM_CANDIDATES)
+            trace_count("duplicate_candidates", duplicates)
+            if not events:
+                continue
+
+            if OPENAI_STREAM_CANDIDATES:
+                best = streamed_best
+            else:
+                best = choose_best_verified_event(events, old_texts, today_ddmm, registry)
+            sp.set(found=bool(best))
+
+    if attempts > 1 and registry.verdicts:
+        stats = registry.stats()
+        print(
+            f"🗂️ Candidatos del día: {stats['candidates']} distintos, {stats['validated']} validados "
+            f"({stats['rejected']} descartados), {stats['duplicates']} repetidos entre rondas."
+        )
+    return best
 
-    # 3) Elegir el mejor evento según orden editorial y validación
-    if not best:
-        print("No se ha podido seleccionar una efeméride válida tras verificación. No se publicará tuit.")
-        return
 
+def print_chosen_event(best):
     print("Evento elegido:")
     print(f"- Año: {best['year']}")
     print(f"- Tipo: {best['type']}")
@@ -1165,46 +4304,496 @@ def main():
         f"Extranjeros: {best.get('has_foreign')}"
     )
 
-    # 4) Generar el tuit titular
+
+def generate_thread(today_year, today_month_name, today_day, best):
+    """
+    Genera titular + tuits de hilo según THREAD_GENERATION_MODE.
+    En modo "structured" se intenta una sola llamada y, si la validación local
+    falla, se recurre a las tres llamadas clásicas. Informa de tokens y latencia.
+    Devuelve (headline, followups) o None si no se pudo generar un titular válido.
+    """
+    with span("text_generation", mode=THREAD_GENERATION_MODE) as sp:
+        thread = _generate_thread(today_year, today_month_name, today_day, best)
+        sp.set(ok=thread is not None)
+    return thread
+
+
+def _generate_thread(today_year, today_month_name, today_day, best):
+    usage_before = openai_usage_totals()
+    start = time.perf_counter()
+    mode = THREAD_GENERATION_MODE
+    thread = None
+
+    if mode == "structured":
+        try:
+            thread = generate_thread_structured(today_year, today_month_name, today_day, best)
+        except Exception as e:
+            print("⚠️ Error generando el hilo en una sola llamada:", e)
+        if thread is None:
+            trace_count("retries")
+            print("↩️ Se recurre a la generación clásica en tres llamadas.")
+            mode = "structured+classic"
+        else:
+            headline, followups = thread
+            print("Tuit titular generado:")
+            print(headline)
+            print(f"Largo: {len(headline)} caracteres")
+            for i, t in enumerate(followups, start=2):
+                print(f"[Tuit {i}] {t} (len={len(t)})")
+
+    if thread is None:
+        thread = _generate_thread_three_calls(today_year, today_month_name, today_day, best)
+
+    usage_after = openai_usage_totals()
+    print(
+        f"🧮 Texto del hilo (modo {mode}): "
+        f"{usage_after['prompt_tokens'] - usage_before['prompt_tokens']} tokens de entrada, "
+        f"{usage_after['completion_tokens'] - usage_before['completion_tokens']} de salida, "
+        f"{usage_after['calls'] - usage_before['calls']} llamadas, "
+        f"{time.perf_counter() - start:.2f} s."
+    )
+    return thread
+
+
+def _generate_thread_three_calls(today_year, today_month_name, today_day, best):
+    """Titular y tuits de hilo en paralelo y, después, control de contradicciones."""
+    # Titular y tuits de hilo no dependen entre sí: se piden a la vez
+    start = time.perf_counter()
+    pool = ThreadPoolExecutor(max_workers=2)
+    headline_future = pool.submit(generate_headline_tweet, today_year, today_month_name, today_day, best)
+    followups_future = pool.submit(generate_followup_tweets, today_year, today_month_name, today_day, best)
+    pool.shutdown(wait=False)
+
     try:
-        headline = generate_headline_tweet(today_year, today_month_name, today_day, best)
+        headline = headline_future.result()
     except Exception as e:
         print("❌ Error al generar el tuit titular con OpenAI:", e)
-        return
+        return None
 
     if not headline or not isinstance(headline, str) or len(headline.strip()) == 0:
         print("❌ OpenAI devolvió un titular vacío o inválido. Abortando para evitar publicar un tuit en blanco.")
-        return
+        return None
 
     print("Tuit titular generado:")
     print(headline)
     print(f"Largo: {len(headline)} caracteres")
 
-    # 5) Generar los tuits de hilo (2º a 6º)
     try:
-        followups = generate_followup_tweets(today_year, today_month_name, today_day, best)
+        followups = followups_future.result()
     except Exception as e:
         print("⚠️ Error generando los tuits de hilo con OpenAI:", e)
         followups = []
 
+    print(f"⏱️ Titular + hilo generados en paralelo en {time.perf_counter() - start:.2f} s.")
     print(f"Se han generado {len(followups)} tuits adicionales para el hilo.")
     for i, t in enumerate(followups, start=2):
         print(f"[Tuit {i}] {t} (len={len(t)})")
 
-    # 6) Anti-contradicciones
-    headline, followups = detect_and_fix_contradictions(headline, followups, best["text"])
+    # Anti-contradicciones
+    with span("contradiction_check", tweets=1 + len(followups)):
+        return detect_and_fix_contradictions(headline, followups, best["text"])
 
-    # 7) Publicar hilo en X
+
+# ----------------- Hilos preparados de antemano (modo prepare) ----------------- #
+
+def load_prepared_threads():
+    """Carga los hilos preparados por dd/mm desde PREPARED_FILE."""
+    if not os.path.exists(PREPARED_FILE):
+        return {}
     try:
-        post_thread(headline, followups)
-        print("✅ Hilo publicado correctamente.")
-    except tweepy.errors.TooManyRequests:
-        print("⚠️ 429 Too Many Requests al publicar el hilo de hoy. Se guarda como pendiente.")
-        save_pending_tweet(headline, followups, today_ddmm)
+        with open(PREPARED_FILE, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        threads = data.get("threads", {})
+        return threads if isinstance(threads, dict) else {}
+    except Exception as e:
+        print(f"⚠️ Error leyendo {PREPARED_FILE}:", e)
+        return {}
+
+
+def save_prepared_threads(threads):
+    """Guarda los hilos preparados, descartando los de fechas ya pasadas."""
+    today = today_date().isoformat()
+    threads = {k: v for k, v in threads.items() if v.get("target_date", "") >= today}
+    try:
+        write_json_atomic(PREPARED_FILE, {"threads": threads}, indent=2)
+    except Exception as e:
+        print(f"⚠️ No se pudo guardar {PREPARED_FILE}:", e)
+
+
+def discard_prepared_thread(target_ddmm):
+    threads = load_prepared_threads()
+    if threads.pop(target_ddmm, None) is not None:
+        save_prepared_threads(threads)
+
+
+def take_prepared_thread(today_ddmm, today, old_texts):
+    """
+    Devuelve el hilo preparado para hoy si existe, su fecha objetivo coincide
+    exactamente con hoy y su evento no se ha publicado ya. Si no, None.
+    """
+    entry = load_prepared_threads().get(today_ddmm)
+    if not entry:
+        return None
+
+    headline = entry.get("headline")
+    if entry.get("target_ddmm") != today_ddmm or entry.get("target_date") != today.isoformat():
+        print(
+            "⚠️ Hay un hilo preparado, pero su fecha objetivo no coincide con hoy. "
+            "No se usará para evitar errores de dd/mm."
+        )
+        return None
+    if not isinstance(headline, str) or not headline.strip():
+        return None
+
+    if event_is_repeated(entry.get("event", {}).get("text", headline), old_texts):
+        print("⚠️ El hilo preparado para hoy repite un evento ya publicado. Se descarta.")
+        discard_prepared_thread(today_ddmm)
+        return None
+
+    print(f"📦 Usando el hilo preparado el {entry.get('prepared_at')} para {today_ddmm}.")
+    return {
+        "headline": headline,
+        "followups": [str(t) for t in entry.get("followups", [])],
+        "target_ddmm": today_ddmm,
+    }
+
+
+def prepare_threads(days=None, force=False):
+    """
+    Genera y guarda hilos completos (ya revisados de contradicciones) para los
+    próximos días, empezando por hoy. La publicación diaria solo tendrá que
+    comprobar la anti-repetición y publicar.
+    """
+    days = max(1, days or PREPARE_DAYS)
+    threads = load_prepared_threads()
+    start = today_date()
+
+    for offset in range(days):
+        date = start + datetime.timedelta(days=offset)
+        year, month, day, month_name = date_info(date)
+        ddmm = f"{day:02d}/{month:02d}"
+
+        existing = threads.get(ddmm)
+        if existing and existing.get("target_date") == date.isoformat() and not force:
+            print(f"⏭️ {ddmm}: ya hay un hilo preparado.")
+            continue
+
+        print(f"🛠️ Preparando hilo para {day}/{month}/{year}...")
+        old_texts = RepetitionIndex(fetch_previous_events_same_day(month, day))
+        best = select_event_for_date(year, month, day, month_name, old_texts)
+        if not best:
+            print(f"⚠️ {ddmm}: sin efeméride válida tras verificación. No se prepara hilo.")
+            continue
+        print_chosen_event(best)
+
+        thread = generate_thread(year, month_name, day, best)
+        if not thread:
+            continue
+        headline, followups = thread
+
+        threads[ddmm] = {
+            "headline": headline,
+            "followups": list(followups),
+            "target_ddmm": ddmm,
+            "target_date": date.isoformat(),
+            "event": {k: v for k, v in best.items() if k != "raw"},
+            "prepared_at": datetime.datetime.utcnow().isoformat() + "Z",
+        }
+        save_prepared_threads(threads)
+        print(f"💾 {ddmm}: hilo preparado y guardado en {PREPARED_FILE}.")
+
+
+# ----------------- Preview de un rango de fechas (sin publicar) ----------------- #
+
+def _preview_worker_init(wikidata_slots):
+    """Inicializa un proceso de preview: reparte entre procesos el límite de peticiones a Wikidata."""
+    global _wikidata_slots
+    _wikidata_slots = threading.BoundedSemaphore(max(1, wikidata_slots))
+
+
+def _write_preview_thread(path, date, event, headline, followups):
+    lines = [
+        f"# {date.strftime('%d/%m/%Y')}: {event.get('entity')} ({event.get('type')}, {event.get('year')})",
+        "",
+        f"- QID: {event.get('qid', '')}",
+        f"- Score: {event.get('score', 'N/A')}",
+        f"- Efeméride: {event.get('text')}",
+        "",
+        "## Hilo",
+        "",
+    ]
+    for i, t in enumerate([headline] + list(followups), start=1):
+        lines.append(f"{i}. {t} ({len(t)} caracteres)")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def preview_day(month, day):
+    """
+    Trabajo de un proceso de preview: elige, valida y redacta el hilo de la próxima
+    aparición de un dd/mm, sin publicar. Deja en PREVIEW_DIR el hilo (DD-MM.md) y la
+    salida del proceso (DD-MM.log). Devuelve (registro del día, entradas nuevas de las
+    cachés para que las guarde el proceso principal, contadores).
+    """
+    date = next_occurrence(month, day)
+    year, month, day, month_name = date_info(date)
+    ddmm = f"{day:02d}/{month:02d}"
+    stem = f"{day:02d}-{month:02d}"
+
+    with _openai_usage_lock:
+        usage_before = {site: dict(stats) for site, stats in _openai_usage.items()}
+    cache_before = {cache.name: (cache.hits, cache.misses) for cache in _CACHES}
+    with _http_stats_lock:
+        http_before = dict(_http_stats)
+
+    record = {
+        "ddmm": ddmm,
+        "date": date.isoformat(),
+        "status": "error",
+        "error": "",
+        "entity": "",
+        "qid": "",
+        "tweets": 0,
+        "selection_s": 0.0,
+        "generation_s": 0.0,
+    }
+    with open(os.path.join(PREVIEW_DIR, f"{stem}.log"), "w", encoding="utf-8") as log, \
+            contextlib.redirect_stdout(log):
+        try:
+            old_texts = RepetitionIndex(fetch_previous_events_same_day(month, day, sync=False))
+            start = time.perf_counter()
+            best = select_event_for_date(year, month, day, month_name, old_texts)
+            record["selection_s"] = round(time.perf_counter() - start, 3)
+            if not best:
+                record["status"] = "no_event"
+            else:
+                print_chosen_event(best)
+                record["entity"], record["qid"] = best["entity"], best.get("qid", "")
+                start = time.perf_counter()
+                thread = generate_thread(year, month_name, day, best)
+                record["generation_s"] = round(time.perf_counter() - start, 3)
+                if not thread:
+                    record["status"] = "no_text"
+                else:
+                    headline, followups = thread
+                    _write_preview_thread(
+                        os.path.join(PREVIEW_DIR, f"{stem}.md"), date, best, headline, followups
+                    )
+                    record["status"] = "ok"
+                    record["tweets"] = 1 + len(followups)
+        except Exception as e:
+            record["error"] = f"{type(e).__name__}: {e}"
+            print("❌ Error en el preview del día:", e)
+
+    with _openai_usage_lock:
+        usage = {}
+        for site, stats in _openai_usage.items():
+            before = usage_before.get(site, {})
+            usage[site] = {k: v - before.get(k, 0) for k, v in stats.items()}
+    with _http_stats_lock:
+        http = {k: v - http_before.get(k, 0) for k, v in _http_stats.items()}
+    counters = {
+        "openai": usage,
+        "http": http,
+        "caches": {
+            cache.name: (cache.hits - cache_before[cache.name][0], cache.misses - cache_before[cache.name][1])
+            for cache in _CACHES
+        },
+    }
+    record["prompt_tokens"] = sum(u.get("prompt_tokens", 0) for u in usage.values())
+    record["completion_tokens"] = sum(u.get("completion_tokens", 0) for u in usage.values())
+    updates = {cache.name: cache.drain_updates() for cache in _CACHES}
+    return record, updates, counters
+
+
+def _merge_preview_counters(counters):
+    """Suma al proceso principal lo que ha contado un proceso de preview (para los informes finales)."""
+    with _openai_usage_lock:
+        for site, delta in counters.get("openai", {}).items():
+            stats = _openai_usage.setdefault(
+                site, {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "seconds": 0.0}
+            )
+            for key, value in delta.items():
+                stats[key] = stats.get(key, 0) + value
+    for key, value in counters.get("http", {}).items():
+        _http_stats_incr(key, value)
+    caches = {cache.name: cache for cache in _CACHES}
+    for name, (hits, misses) in counters.get("caches", {}).items():
+        if name in caches:
+            caches[name].hits += hits
+            caches[name].misses += misses
+
+
+def _stage_stats(values):
+    if not values:
+        return {"mean": 0.0, "max": 0.0}
+    return {"mean": round(sum(values) / len(values), 3), "max": round(max(values), 3)}
+
+
+def run_preview(from_ddmm=None, to_ddmm=None, workers=None):
+    """
+    Genera, sin publicar nada, el hilo que saldría cada día de un rango dd/mm,
+    repartiendo los días entre procesos. Las cachés se comparten: cada proceso
+    arranca con las del disco y el principal guarda lo que van añadiendo.
+    Escribe un hilo por día y un informe agregado (PREVIEW_DIR/report.json).
+    """
+    workers = max(1, workers or PREVIEW_WORKERS)
+    wikidata_limit = max(1, WIKIDATA_MAX_WORKERS)
+    if WIKIDATA_BACKEND != "offline" and workers > wikidata_limit:
+        # Cada proceso necesita al menos una petición a Wikidata: más procesos superarían el límite
+        print(f"⚠️ {workers} procesos superan WIKIDATA_MAX_WORKERS={wikidata_limit}; se usan {wikidata_limit}.")
+        workers = wikidata_limit
+    from_ddmm = from_ddmm or today_date().strftime("%d/%m")
+    days = ddmm_range(from_ddmm, to_ddmm or from_ddmm)
+    os.makedirs(PREVIEW_DIR, exist_ok=True)
+
+    # Historial de X una sola vez; los procesos solo leen la copia local
+    if TIMELINE_DB_FILE:
+        try:
+            conn = open_timeline_db()
+            try:
+                sync_timeline(conn)
+            finally:
+                conn.close()
+        except Exception as e:
+            print("⚠️ No se pudo sincronizar el historial del timeline:", e)
+    for cache in _CACHES:
+        cache.save()
+
+    print(f"🔭 Preview de {len(days)} días ({from_ddmm} → {to_ddmm or from_ddmm}) con {workers} procesos.")
+    start = time.perf_counter()
+    records = {}
+    pool = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_preview_worker_init,
+        initargs=(wikidata_limit // workers,),
+    )
+    with pool:
+        futures = {pool.submit(preview_day, m, d): (m, d) for m, d in days}
+        for future in as_completed(futures):
+            month, day = futures[future]
+            try:
+                record, updates, counters = future.result()
+            except Exception as e:
+                record = {"ddmm": f"{day:02d}/{month:02d}", "status": "error", "error": f"{type(e).__name__}: {e}"}
+                updates, counters = {}, {}
+
+            for cache in _CACHES:
+                cache.merge(updates.get(cache.name, []))
+                cache.save()
+            _merge_preview_counters(counters)
+            records[(month, day)] = record
+
+            icon = {"ok": "✅", "no_event": "⚠️", "no_text": "⚠️"}.get(record["status"], "❌")
+            detail = record.get("entity") or record.get("error") or record["status"]
+            print(f"{icon} {record['ddmm']}: {detail}")
+
+    ordered = [records[d] for d in days if d in records]
+    counts = {}
+    for record in ordered:
+        counts[record["status"]] = counts.get(record["status"], 0) + 1
+    summary = {
+        "from": from_ddmm,
+        "to": to_ddmm or from_ddmm,
+        "generated_at": datetime.datetime.utcnow().isoformat() + "Z",
+        "workers": workers,
+        "days": len(ordered),
+        "threads": counts.get("ok", 0),
+        "yield": round(counts.get("ok", 0) / len(ordered), 3) if ordered else 0.0,
+        "statuses": counts,
+        "wall_s": round(time.perf_counter() - start, 3),
+        "selection_s": _stage_stats([r["selection_s"] for r in ordered if "selection_s" in r]),
+        "generation_s": _stage_stats([r["generation_s"] for r in ordered if r.get("generation_s")]),
+        "prompt_tokens": sum(r.get("prompt_tokens", 0) for r in ordered),
+        "completion_tokens": sum(r.get("completion_tokens", 0) for r in ordered),
+    }
+    report_path = os.path.join(PREVIEW_DIR, "report.json")
+    write_json_atomic(report_path, {"summary": summary, "days": ordered}, indent=2)
+
+    print(
+        f"📋 Preview: {summary['threads']}/{summary['days']} días con hilo "
+        f"({summary['yield']:.0%}), {len(ordered) - summary['threads']} sin hilo, "
+        f"{summary['wall_s']:.1f} s. Informe en {report_path}."
+    )
+    return summary
+
+
+# ----------------- Main ----------------- #
+
+def main(mode="publish"):
+    """
+    Ejecución diaria. mode:
+    - "publish": elige, genera y publica el hilo de hoy (por defecto);
+    - "dry-run": igual pero sin publicar ni tocar el diario (no crea clientes de X);
+    - "validate-only": solo elige y valida la efeméride de hoy, sin generar texto.
+    """
+    today_year, today_month, today_day, today_month_name = today_info()
+    today_ddmm = f"{today_day:02d}/{today_month:02d}"
+    publish = mode == "publish"
+
+    print(f"Hoy es {today_day}/{today_month}/{today_year} ({today_month_name}).")
+    if not publish:
+        print(f"🧪 Modo {mode}: no se publicará nada en X.")
+
+    # 0) Hilos del diario sin terminar (429 o fallo a medias en ejecuciones anteriores)
+    if publish:
+        scheduler = PublishScheduler()
+        with span("pending_publish") as sp:
+            resumed = resume_journal_threads(today_ddmm, scheduler)
+            sp.set(published=resumed)
+        if not resumed:
+            return
+        if journal_published_on(today_date()):
+            print("✅ El hilo de hoy ya está publicado según el diario. No se publicará otro.")
+            return
+
+    # 1) Anti-repetición basándose en tu timeline (sin consultar X si no se va a publicar)
+    with span("timeline_fetch") as sp:
+        old_texts = RepetitionIndex(fetch_previous_events_same_day(today_month, today_day, sync=publish))
+        sp.set(previous=len(old_texts))
+
+    # 2) Si el hilo de hoy se preparó de antemano, solo queda publicarlo
+    prepared = take_prepared_thread(today_ddmm, today_date(), old_texts) if mode != "validate-only" else None
+    if prepared:
+        headline, followups = prepared["headline"], prepared["followups"]
+    else:
+        # 3) Elegir el mejor evento según orden editorial y validación
+        best = select_event_for_date(today_year, today_month, today_day, today_month_name, old_texts)
+        if not best:
+            print("No se ha podido seleccionar una efeméride válida tras verificación. No se publicará tuit.")
+            return
+
+        print_chosen_event(best)
+        if mode == "validate-only":
+            return
+
+        # 4-6) Titular, tuits de hilo y anti-contradicciones
+        thread = generate_thread(today_year, today_month_name, today_day, best)
+        if not thread:
+            return
+        headline, followups = thread
+
+    if not publish:
+        print("🧪 Hilo que se publicaría:")
+        for i, t in enumerate([headline] + list(followups), start=1):
+            print(f"[Tuit {i}] {t}")
+        return
+
+    # 7) Publicar hilo en X (pasa por el diario: un fallo a medias se retoma en la siguiente ejecución)
+    try:
+        if post_thread(headline, followups, today_ddmm, scheduler):
+            print("✅ Hilo publicado correctamente.")
+    except (tweepy.errors.TooManyRequests, TimeoutError):
+        print("⚠️ Rate limit de X al publicar el hilo de hoy. Queda en el diario de publicación.")
         return
     except Exception as e:
         print("❌ Error publicando el hilo en Twitter/X:", e)
         raise
+    finally:
+        # El texto ya está en el diario: el hilo preparado sobra en cualquier caso
+        if prepared:
+            discard_prepared_thread(today_ddmm)
 
 
 def run_wikidata_validation_smoke_test():
@@ -1222,8 +4811,161 @@ def run_wikidata_validation_smoke_test():
     print(f"Resultado test Felipe III (death) vs {today_ddmm}: {is_valid}")
 
 
+def run_offline_index_smoke_test(dump_path=None):
+    """
+    Smoke test sin red del índice offline: construye en un directorio temporal el
+    índice del volcado de ejemplo (fixtures/wikidata_sample.jsonl) y comprueba la
+    búsqueda label → QID y que las fechas con precisión de año o de mes se descartan
+    tanto en el índice como en los claims. Sale con error si algo no cuadra.
+    """
+    global WIKIDATA_INDEX_FILE
+    dump_path = dump_path or WIKIDATA_INDEX_FIXTURE
+    claims = {e["id"]: e.get("claims", {}) for e in iter_dump_entities(dump_path)}
+
+    previous_index = WIKIDATA_INDEX_FILE
+    with tempfile.TemporaryDirectory() as tmp:
+        WIKIDATA_INDEX_FILE = os.path.join(tmp, "wikidata_index.sqlite3")
+        _offline_index_local.conn = None
+        try:
+            kept = build_wikidata_index(dump_path, WIKIDATA_INDEX_FILE)
+            checks = [
+                ("entidades con fecha en el índice", kept, 4),
+                ("label → QID", offline_search_entity_id("Douglas Adams"), "Q42"),
+                ("label sin normalizar", offline_search_entity_id("  douglas ADAMS "), "Q42"),
+                ("alias compartido → más sitelinks", offline_search_entity_id("Colón"), "Q7322"),
+                ("entidad sin fechas", offline_search_entity_id("Entidad sintética sin fechas"), None),
+                ("índice: nacimiento con precisión de año", offline_dates_for_qid("Q7322")["P569"], []),
+                ("índice: muerte con precisión de día", offline_dates_for_qid("Q7322")["P570"], ["+1506-05-20T00:00:00Z"]),
+                ("índice: fecha con precisión de mes", offline_dates_for_qid("Q900000002")["P585"], []),
+                ("claims: nacimiento con precisión de año", _extract_time_values(claims["Q7322"], "P569"), []),
+                ("claims: fecha con precisión de mes", _extract_time_values(claims["Q900000002"], "P585"), []),
+                ("claims: precisión de día", _extract_time_values(claims["Q42"], "P569"), ["+1952-03-11T00:00:00Z"]),
+            ]
+        finally:
+            conn = getattr(_offline_index_local, "conn", None)
+            if conn is not None:
+                conn.close()
+            _offline_index_local.conn = None
+            WIKIDATA_INDEX_FILE = previous_index
+
+    failed = 0
+    for name, got, expected in checks:
+        ok = got == expected
+        failed += not ok
+        print(f"{'✅' if ok else '❌'} {name}: {got!r}" + ("" if ok else f" (se esperaba {expected!r})"))
+    if failed:
+        raise SystemExit(f"❌ Índice offline: {failed} de {len(checks)} comprobaciones fallidas.")
+    print(f"✅ Índice offline: {len(checks)} comprobaciones correctas.")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Bot de efemérides de @Efemerides_Imp.")
+    subparsers = parser.add_subparsers(dest="command")
+
+    subparsers.add_parser("publish", help="Ejecución diaria: elige, genera y publica el hilo de hoy (por defecto).")
+    subparsers.add_parser("dry-run", help="Como publish, pero muestra el hilo en vez de publicarlo.")
+    subparsers.add_parser("validate-only", help="Solo elige y valida en Wikidata la efeméride de hoy.")
+    smoke = subparsers.add_parser("smoke-test", help="Smoke test de la validación contra Wikidata.")
+    smoke.add_argument(
+        "--offline",
+        action="store_true",
+        help="Sin red: construye el índice offline de un volcado de ejemplo y lo comprueba.",
+    )
+    smoke.add_argument("--dump", help="Volcado para --offline (por defecto fixtures/wikidata_sample.jsonl).")
+
+    build = subparsers.add_parser(
+        "build-store",
+        help="Precalcula y valida los candidatos de cada dd/mm en el almacén offline.",
+    )
+    build.add_argument("--from", dest="from_ddmm", help="Primer día dd/mm (por defecto 01/01).")
+    build.add_argument("--to", dest="to_ddmm", help="Último día dd/mm (por defecto 31/12).")
+    build.add_argument("--force", action="store_true", help="Reconstruye también los días ya guardados.")
+    build.add_argument("--workers", type=int, default=STORE_BUILD_WORKERS, help="Días en paralelo.")
+
+    prepare = subparsers.add_parser(
+        "prepare",
+        help="Genera de antemano los hilos de los próximos días (sin publicar).",
+    )
+    prepare.add_argument("--days", type=int, default=PREPARE_DAYS, help="Número de días, empezando por hoy.")
+    prepare.add_argument("--force", action="store_true", help="Regenera también los hilos ya preparados.")
+
+    preview = subparsers.add_parser(
+        "preview",
+        help="Genera sin publicar el hilo de cada día de un rango dd/mm, en paralelo.",
+    )
+    preview.add_argument("--from", dest="from_ddmm", help="Primer día dd/mm (por defecto hoy).")
+    preview.add_argument("--to", dest="to_ddmm", help="Último día dd/mm (por defecto el mismo que --from).")
+    preview.add_argument("--workers", type=int, default=PREVIEW_WORKERS, help="Procesos en paralelo.")
+
+    index = subparsers.add_parser(
+        "build-wikidata-index",
+        help="Construye el índice offline de Wikidata a partir de un volcado JSON (o un subconjunto).",
+    )
+    index.add_argument("dump", help="Volcado JSON de Wikidata (.json, .json.gz, .json.bz2 o JSON Lines).")
+    index.add_argument("--output", help=f"Ruta del índice (por defecto {WIKIDATA_INDEX_FILE}).")
+
+    day_index = subparsers.add_parser(
+        "build-day-index",
+        help="Construye el índice inverso dd/mm → QIDs a partir de resultados SPARQL o de un volcado.",
+    )
+    day_index.add_argument(
+        "sources",
+        nargs="+",
+        help="Resultados SPARQL (.json), volcado de Wikidata (.json/.gz/.bz2/JSON Lines) o índice offline (.sqlite3).",
+    )
+    day_index.add_argument("--output", help=f"Ruta del índice (por defecto {WIKIDATA_DAY_INDEX_FILE}).")
+
+    audit = subparsers.add_parser(
+        "audit",
+        help="Audita una exportación de tuits (tweets.js / JSON / JSONL / CSV) contra Wikidata.",
+    )
+    audit.add_argument("archive", nargs="?", help="Ruta de la exportación de X.")
+    audit.add_argument("--format", choices=("json", "csv"), default="json", help="Formato del informe.")
+    audit.add_argument("--output", help="Ruta del informe (por defecto audit_report.<formato>).")
+    audit.add_argument("--workers", type=int, default=AUDIT_WORKERS, help="Tuits auditados en paralelo.")
+    audit.add_argument("--all", action="store_true", help="Incluye también los tuits correctos.")
+    audit.add_argument("--force", action="store_true", help="Revalida todos los tuits, aunque ya tengan veredicto.")
+    audit.add_argument(
+        "--report-only",
+        action="store_true",
+        help="No audita nada: solo regenera el informe desde los veredictos guardados.",
+    )
+
+    return parser.parse_args(argv)
+
+
 if __name__ == "__main__":
-    if os.getenv("RUN_WIKIDATA_TEST") == "1":
-        run_wikidata_validation_smoke_test()
-    else:
-        main()
+    args = parse_args()
+    start_trace(args.command or "publish")
+    try:
+        if args.command == "build-store":
+            build_candidate_store(args.from_ddmm, args.to_ddmm, args.force, args.workers)
+        elif args.command == "prepare":
+            prepare_threads(args.days, args.force)
+        elif args.command == "preview":
+            run_preview(args.from_ddmm, args.to_ddmm, args.workers)
+        elif args.command == "build-wikidata-index":
+            build_wikidata_index(args.dump, args.output)
+        elif args.command == "build-day-index":
+            build_day_index(args.sources, args.output)
+        elif args.command == "audit":
+            if args.report_only:
+                rebuild_audit_report(args.output, args.format, args.all)
+            elif not args.archive:
+                print("❌ Falta la ruta de la exportación de X (o usa --report-only).")
+            else:
+                run_audit(args.archive, args.output, args.format, args.workers, args.all, args.force)
+        elif args.command in ("dry-run", "validate-only"):
+            main(args.command)
+        elif args.command == "smoke-test" and args.offline:
+            run_offline_index_smoke_test(args.dump)
+        elif args.command == "smoke-test" or (args.command is None and os.getenv("RUN_WIKIDATA_TEST") == "1"):
+            run_wikidata_validation_smoke_test()
+        else:
+            main()
+    finally:
+        flush_caches()
+        report_label_resolver()
+        report_http_stats()
+        report_openai_usage()
+        finish_trace()